@@ -0,0 +1,235 @@
+"""
+biolabtool - single command-line entry point
+
+    python biolabtool.py extract paper.pdf [paper2.pdf ...]
+    python biolabtool.py annotate figures/ --db maldi_database.csv --source "Smith 2024"
+    python biolabtool.py crop raw_images/ cropped/ --workers 8
+    python biolabtool.py search maldi_database.snap --mz 885.5 --tolerance 0.01
+    python biolabtool.py volcano KO_vs_WT.csv --config study.json --formats png pdf
+
+Only the standard library is imported at start-up; each subcommand imports
+what it needs (anthropic and fitz for extract, pandas for CSV databases,
+matplotlib for volcano...) when it runs, so a snapshot search starts fast.
+--import-times re-runs the command under `python -X importtime` and prints
+the slowest top-level imports after it finishes.
+
+Dependencies: standard library (subcommands need their modules' dependencies)
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+
+def cmd_extract(args):
+    from pdf_extractor import MALDIFigureExtractor
+
+    extractor = MALDIFigureExtractor()
+    results = extractor.batch_extract(args.pdfs, output_folder=args.output_dir,
+                                      confidence_threshold=args.threshold)
+    return 0 if any(results.values()) else 1
+
+
+def cmd_annotate(args):
+    from database_builder import MALDIDatabase
+
+    db = MALDIDatabase(args.db, dedup_tolerance=args.dedup_tolerance)
+    for path in args.images:
+        try:
+            if os.path.isdir(path):
+                db.batch_process(path, args.source, panels=args.panels)
+            elif args.panels:
+                db.add_figure_panels(path, args.source)
+            else:
+                db.add_image(path, args.source)
+        except Exception as e:
+            print(f"Error processing {path}: {e}")
+    db.save()
+    return 0
+
+
+def cmd_crop(args):
+    from image_crop import auto_crop_maldi, batch_crop
+
+    if os.path.isdir(args.input):
+        results = batch_crop(args.input, args.output or "cropped_images", padding=args.padding,
+                             workers=args.workers, report_path=args.report,
+                             proxy_size=args.proxy_size)
+        return 1 if any(r['status'] == 'error' for r in results) else 0
+    output = args.output or "{0}_cropped{1}".format(*os.path.splitext(args.input))
+    auto_crop_maldi(args.input, output, padding=args.padding, proxy_size=args.proxy_size)
+    return 0
+
+
+def _write_rows(snapshot, rows, columns):
+    # Snapshot results go straight to CSV, without loading pandas
+    import csv
+
+    columns = columns or snapshot.columns
+    writer = csv.writer(sys.stdout)
+    writer.writerow(columns)
+    writer.writerows(zip(*(snapshot.column_values(c, rows) for c in columns)))
+
+
+def _open_search_database(path):
+    from snapshot import MALDISnapshot, is_snapshot
+
+    if is_snapshot(path):
+        return MALDISnapshot(path)
+    from database_builder import MALDIDatabase
+    return MALDIDatabase(path, read_only=True)
+
+
+def cmd_search(args):
+    from snapshot import MALDISnapshot
+
+    db = _open_search_database(args.database)
+    if args.stats:
+        import json
+        print(json.dumps(db.get_statistics(), indent=2))
+    elif isinstance(db, MALDISnapshot) and not args.peaks:
+        if args.mz is not None:
+            rows = db.find_mz(args.mz, args.tolerance)
+        elif args.metabolite is not None:
+            rows = db.find_metabolite(args.metabolite)
+        else:
+            rows = db.find_literature(args.source)
+        _write_rows(db, rows, args.columns)
+    else:
+        if args.peaks:
+            results = db.match_peaks(args.peaks, args.tolerance, columns=args.columns)
+        elif args.mz is not None:
+            results = db.search_by_mz(args.mz, args.tolerance, columns=args.columns)
+        elif args.metabolite is not None:
+            results = db.search_by_metabolite(args.metabolite, columns=args.columns)
+        else:
+            results = db.search_by_literature(args.source, columns=args.columns)
+        results.to_csv(sys.stdout, index=False)
+    return 0
+
+
+def cmd_volcano(args):
+    if not args.jobs:
+        import volcano_plot
+        volcano_plot.main()
+        return 0
+
+    from volcano_batch import batch_render, build_jobs
+
+    reports = batch_render(build_jobs(args.jobs, args.config), args.out_dir, args.formats,
+                           args.workers, args.dpi, tuple(args.size))
+    failed = sum(1 for r in reports if r["error"])
+    print(f"\nRendered {len(reports) - failed}/{len(reports)} plots to {args.out_dir}")
+    return 1 if failed else 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="biolabtool", description="MALDI and metabolomics tools")
+    parser.add_argument("--import-times", action="store_true",
+                        help="Report module import times (python -X importtime) after the command")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    p = commands.add_parser("extract", help="Extract MALDI figures from PDFs")
+    p.add_argument("pdfs", nargs="+")
+    p.add_argument("--output-dir", default="extracted_maldi_figures")
+    p.add_argument("--threshold", type=float, default=70.0, help="Confidence threshold (%%)")
+    p.set_defaults(func=cmd_extract)
+
+    p = commands.add_parser("annotate", help="Annotate MALDI images into the CSV database")
+    p.add_argument("images", nargs="+", help="Image files or folders")
+    p.add_argument("--db", default="maldi_database.csv")
+    p.add_argument("--source", default="", help="Literature source recorded with each entry")
+    p.add_argument("--panels", action="store_true",
+                   help="Split multi-panel figures and annotate each ion image")
+    p.add_argument("--dedup-tolerance", type=float, default=None,
+                   help="Also skip near-duplicate m/z within this tolerance")
+    p.set_defaults(func=cmd_annotate)
+
+    p = commands.add_parser("crop", help="Crop MALDI images to the tissue")
+    p.add_argument("input", help="Image file or folder")
+    p.add_argument("output", nargs="?", help="Output file or folder")
+    p.add_argument("--padding", type=int, default=10)
+    p.add_argument("--workers", type=int, default=None)
+    p.add_argument("--proxy-size", type=int, default=None,
+                   help="Find the tissue on a proxy of this size (very large images)")
+    p.add_argument("--report", default=None, help="Per-file CSV report (folders)")
+    p.set_defaults(func=cmd_crop)
+
+    p = commands.add_parser("search", help="Search a database (CSV or snapshot), results as CSV")
+    p.add_argument("database")
+    query = p.add_mutually_exclusive_group(required=True)
+    query.add_argument("--mz")
+    query.add_argument("--peaks", type=float, nargs="+", help="Match several peaks at once")
+    query.add_argument("--metabolite")
+    query.add_argument("--source")
+    query.add_argument("--stats", action="store_true", help="Summary statistics (JSON)")
+    p.add_argument("--tolerance", type=float, default=0.5)
+    p.add_argument("--columns", nargs="+", default=None)
+    p.set_defaults(func=cmd_search)
+
+    p = commands.add_parser("volcano", help="Volcano plots (GUI without tables, batch with them)")
+    p.add_argument("jobs", nargs="*", metavar="CSV[:CONFIG]")
+    p.add_argument("--config", help="JSON config applied to every job")
+    p.add_argument("--out-dir", default="volcano_plots")
+    p.add_argument("--formats", nargs="+", default=["png"], choices=("png", "svg", "pdf"))
+    p.add_argument("--workers", type=int, default=None)
+    p.add_argument("--dpi", type=int, default=150)
+    p.add_argument("--size", type=float, nargs=2, default=[6.4, 4.8], metavar=("W", "H"))
+    p.set_defaults(func=cmd_volcano)
+    return parser
+
+
+def parse_importtime(lines):
+    """
+    Cumulative microseconds per top-level module from `-X importtime` output
+    ("import time: self [us] | cumulative | module", nesting shown by indentation).
+    """
+    times = {}
+    for line in lines:
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, module = line[len("import time:"):].split("|", 2)
+        if module.startswith("  "):
+            continue  # imported by another module, counted in its cumulative time
+        module = module.strip()
+        times[module] = times.get(module, 0) + int(cumulative)
+    return times
+
+
+def run_with_import_times(argv):
+    """Run argv under -X importtime; pass other stderr through, then print a summary."""
+    start = time.perf_counter()
+    process = subprocess.run([sys.executable, "-X", "importtime", os.path.abspath(__file__)] + argv,
+                             stderr=subprocess.PIPE, text=True)
+    elapsed = time.perf_counter() - start
+
+    lines = process.stderr.splitlines()
+    for line in lines:
+        if not line.startswith("import time:"):
+            print(line, file=sys.stderr)
+    times = parse_importtime(lines)
+
+    print(f"\nImport times ({elapsed:.2f}s total run, "
+          f"{sum(times.values()) / 1e6:.2f}s importing):", file=sys.stderr)
+    for module, us in sorted(times.items(), key=lambda item: -item[1])[:15]:
+        print(f"  {us / 1000:8.1f} ms  {module}", file=sys.stderr)
+    return process.returncode
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    args = build_parser().parse_args(argv)
+    if args.import_times:
+        return run_with_import_times([a for a in argv if a != "--import-times"])
+    try:
+        return args.func(args)
+    except BrokenPipeError:
+        # Output piped into e.g. head, which exited early
+        sys.stdout = open(os.devnull, "w")
+        return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
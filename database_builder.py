@@ -4,17 +4,33 @@ MALDI Imaging Mass Spectrometry Database Management System
 Extract metabolite annotations from MALDI imaging figures using Claude AI
 and manage them in a CSV database.
 
-Features: Automated m/z extraction, CSV storage, batch processing, tolerance-based search
+Features: Automated m/z extraction, CSV storage, batch processing, tolerance-based search,
+insert-time duplicate detection
 Dependencies: anthropic, pandas
 """
 
-import anthropic
+import numpy as np
 import pandas as pd
 import base64
 import os
+import socket
+import sys
 from pathlib import Path
 from typing import List, Dict, Optional
 
+from db_stats import DatabaseStats
+from dedup import DedupIndex
+from shard_merge import mz_sort_order, shard_name
+
+
+MEDIA_TYPES = {
+    '.jpg': 'image/jpeg', '.jpeg': 'image/jpeg',
+    '.png': 'image/png', '.gif': 'image/gif', '.webp': 'image/webp'
+}
+
+COLUMNS = ['image_filename', 'mz_value', 'metabolite_name',
+           'tissue_type', 'literature_source', 'notes']
+
 
 class MALDIDatabase:
     """
@@ -23,27 +39,130 @@ class MALDIDatabase:
     Handles: image reading via Claude AI, m/z extraction, CSV storage, search
     """
     
-    def __init__(self, csv_path: str = "maldi_database.csv", api_key: Optional[str] = None):
+    def __init__(self, csv_path: str = "maldi_database.csv", api_key: Optional[str] = None,
+                 dedup_tolerance: Optional[float] = None, read_only: bool = False):
         """
         Initialize database. Loads existing CSV or creates new one.
         
         Args:
             csv_path: Path to CSV database file
             api_key: Anthropic API key (or use ANTHROPIC_API_KEY env var)
+            dedup_tolerance: Also reject near-duplicates - same figure and
+                normalised metabolite name with m/z within this many Da
+                (default None: exact duplicates only)
+            read_only: Search-only mode - columns are read from the CSV on first
+                use, and adding records or saving is not allowed
         """
         self.csv_path = csv_path
-        self.client = anthropic.Anthropic(api_key=api_key or os.environ.get("ANTHROPIC_API_KEY"))
+        self.read_only = read_only
+        self._api_key = api_key
+        self._client = None
+        self._dedup_tolerance = dedup_tolerance
+        self._dedup_index = None
+        self._stats = None
         
         # Load existing database or create new one
-        if os.path.exists(csv_path):
+        if os.path.exists(csv_path) and read_only:
+            # Header only; columns are loaded by _columns() when needed
+            self._all_columns = list(pd.read_csv(csv_path, nrows=0).columns)
+            self._frame = None
+            # stderr: read-only opens serve searches whose results go to stdout
+            print(f"Opened {csv_path} read-only", file=sys.stderr)
+        elif os.path.exists(csv_path):
             self.df = pd.read_csv(csv_path)
             print(f"Loaded existing database with {len(self.df)} entries from {csv_path}")
         else:
-            self.df = pd.DataFrame(columns=[
-                'image_filename', 'mz_value', 'metabolite_name', 
-                'tissue_type', 'literature_source', 'notes'
-            ])
+            self.df = pd.DataFrame(columns=COLUMNS)
             print(f"Initialized new database at {csv_path}")
+        
+        if not read_only:
+            legacy_duplicates = self._count_duplicates()
+            if legacy_duplicates:
+                print(f"Warning: {legacy_duplicates} duplicate entries in {self.csv_path} "
+                      f"(call remove_duplicates() to drop them)")
+    
+    @property
+    def client(self):
+        """Anthropic API client, created on first annotation call."""
+        if self._client is None:
+            import anthropic  # only needed for annotation; keeps search-only start-up light
+            self._client = anthropic.Anthropic(
+                api_key=self._api_key or os.environ.get("ANTHROPIC_API_KEY")
+            )
+        return self._client
+    
+    @property
+    def df(self) -> pd.DataFrame:
+        """Full database table (loads every column in read-only mode)."""
+        return self._columns(self._all_columns)
+    
+    @df.setter
+    def df(self, value: pd.DataFrame):
+        # Replaced from outside: indexes are rebuilt on next use
+        self._set_frame(value)
+        self._dedup_index = None
+        self._stats = None
+    
+    def _set_frame(self, value: pd.DataFrame):
+        self._frame = value
+        self._all_columns = list(value.columns)
+    
+    def _columns(self, columns: List[str]) -> pd.DataFrame:
+        """Table with at least the given columns loaded, reading missing ones from the CSV."""
+        loaded = [] if self._frame is None else list(self._frame.columns)
+        missing = [c for c in dict.fromkeys(columns) if c not in loaded and c in self._all_columns]
+        if missing:
+            part = pd.read_csv(self.csv_path, usecols=missing)
+            if self._frame is None:
+                self._frame = part
+            else:
+                for column in missing:
+                    self._frame[column] = part[column].to_numpy()
+            if set(self._frame.columns) == set(self._all_columns):
+                self._frame = self._frame[self._all_columns]
+        return self._frame
+    
+    def _project(self, results: pd.DataFrame, columns: Optional[List[str]]) -> pd.DataFrame:
+        return results if columns is None else results[columns]
+    
+    def _check_writable(self):
+        if self.read_only:
+            raise RuntimeError(f"Database {self.csv_path} is opened read-only")
+    
+    def _count_duplicates(self) -> int:
+        """Exact duplicates (same keys as DedupIndex exact mode), counted vectorised."""
+        table = self._columns(['image_filename', 'mz_value', 'metabolite_name'])
+        if table.empty:
+            return 0
+        mz_text = table['mz_value'].astype(str).str.strip()
+        mz = pd.to_numeric(mz_text, errors='coerce')
+        keys = pd.DataFrame({
+            'image': table['image_filename'].astype(str),
+            # Numeric m/z compare by value ("885.5" == "885.50"), others as lowercase text
+            'mz': mz,
+            'mz_text': mz_text.str.lower().where(mz.isna(), ''),
+            'name': table['metabolite_name'].astype(str).str.strip(),
+        })
+        return int(keys.duplicated().sum())
+    
+    @property
+    def dedup_index(self) -> DedupIndex:
+        """Index of records already in the table; built on first insert."""
+        if self._dedup_index is None:
+            self._dedup_index = DedupIndex(mz_tolerance=self._dedup_tolerance)
+            table = self._columns(['image_filename', 'mz_value', 'metabolite_name'])
+            for record in table.to_dict('records'):
+                self._dedup_index.add(record)
+        return self._dedup_index
+    
+    @property
+    def stats(self) -> DatabaseStats:
+        """Running statistics, kept up to date as records are added or removed."""
+        if self._stats is None:
+            self._stats = DatabaseStats.from_frame(self._columns(
+                ['metabolite_name', 'image_filename', 'tissue_type', 'literature_source']
+            ))
+        return self._stats
     
     def encode_image(self, image_path: str) -> str:
         """Convert image to base64 encoding for API transmission."""
@@ -55,15 +174,18 @@ class MALDIDatabase:
         Extract MALDI annotations from image using Claude AI.
         Returns Claude's text response with m/z values and metabolite names.
         """
-        image_data = self.encode_image(image_path)
-        
         # Determine MIME type from file extension
-        suffix = Path(image_path).suffix.lower()
-        media_type_map = {
-            '.jpg': 'image/jpeg', '.jpeg': 'image/jpeg',
-            '.png': 'image/png', '.gif': 'image/gif', '.webp': 'image/webp'
-        }
-        media_type = media_type_map.get(suffix, 'image/jpeg')
+        media_type = MEDIA_TYPES.get(Path(image_path).suffix.lower(), 'image/jpeg')
+        with open(image_path, "rb") as image_file:
+            return self.extract_annotations_from_bytes(image_file.read(), media_type)
+    
+    def extract_annotations_from_bytes(self, image_bytes: bytes,
+                                       media_type: str = "image/png") -> str:
+        """
+        Extract MALDI annotations from in-memory image data (e.g. the output of
+        image_crop.auto_crop_maldi_buffer) - no temporary files needed.
+        """
+        image_data = base64.standard_b64encode(image_bytes).decode("utf-8")
         
         # Send to Claude API
         message = self.client.messages.create(
@@ -148,23 +270,96 @@ Be precise with m/z values and metabolite names."""
         Process single MALDI image and add to database.
         Remember to call save() to persist changes.
         """
+        self._check_writable()
         print(f"Processing: {image_path}")
         
-        response = self.extract_annotations(image_path)
+        media_type = MEDIA_TYPES.get(Path(image_path).suffix.lower(), 'image/jpeg')
+        with open(image_path, "rb") as image_file:
+            self.add_image_bytes(image_file.read(), Path(image_path).name,
+                                 literature_source, media_type)
+    
+    def add_image_bytes(self, image_bytes: bytes, filename: str, literature_source: str = "",
+                        media_type: str = "image/png"):
+        """
+        Process in-memory MALDI image and add to database under filename.
+        Remember to call save() to persist changes.
+        """
+        self._check_writable()
+        response = self.extract_annotations_from_bytes(image_bytes, media_type)
         print(f"\nClaude's response:\n{response}\n")
         
-        filename = Path(image_path).name
         records = self.parse_claude_response(response, filename, literature_source)
         
         if records:
-            new_df = pd.DataFrame(records)
-            self.df = pd.concat([self.df, new_df], ignore_index=True)
-            print(f"Successfully added {len(records)} records from {filename}")
+            added = self.add_records(records)
+            skipped = len(records) - added
+            print(f"Successfully added {added} records from {filename}"
+                  + (f" ({skipped} duplicates skipped)" if skipped else ""))
+        else:
+            print(f"Warning: No valid records extracted from {filename}")
+    
+    def add_figure_panels(self, image_path: str, literature_source: str = "",
+                          max_workers: int = 4):
+        """
+        Split a multi-panel figure into ion-image tiles (image_crop.segment_panels)
+        and annotate the tiles concurrently. Records keep the figure's filename;
+        notes say which panel (and tile box) each m/z came from.
+        Remember to call save() to persist changes.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        from image_crop import segment_panels
+        
+        self._check_writable()
+        filename = Path(image_path).name
+        with open(image_path, "rb") as image_file:
+            panels = segment_panels(image_file.read(), output_format='.png')
+        print(f"Processing: {image_path} ({len(panels)} panels)")
+        if not panels:
+            print(f"Warning: No panels found in {filename}")
+            return
+        
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            responses = list(pool.map(
+                lambda panel: self.extract_annotations_from_bytes(panel['tile'], "image/png"),
+                panels
+            ))
+        
+        records = []
+        for panel, response in zip(panels, responses):
+            x, y, w, h = panel['box']
+            for record in self.parse_claude_response(response, filename, literature_source):
+                location = f"panel {panel['index']} (x={x}, y={y}, w={w}, h={h})"
+                record['notes'] = f"{location}; {record['notes']}" if record['notes'] else location
+                records.append(record)
+        
+        if records:
+            added = self.add_records(records)
+            skipped = len(records) - added
+            print(f"Successfully added {added} records from {len(panels)} panels of {filename}"
+                  + (f" ({skipped} duplicates skipped)" if skipped else ""))
         else:
             print(f"Warning: No valid records extracted from {filename}")
     
-    def batch_process(self, image_folder: str, literature_source: str = ""):
-        """Process all images in folder. Continues on errors."""
+    def add_records(self, records: List[Dict]) -> int:
+        """
+        Append records, skipping any already in the database (see DedupIndex).
+        Returns number of records added.
+        """
+        self._check_writable()
+        new_records = [record for record in records if self.dedup_index.add(record)]
+        if new_records:
+            self._set_frame(pd.concat([self.df, pd.DataFrame(new_records)], ignore_index=True))
+            if self._stats is not None:
+                for record in new_records:
+                    self._stats.add(record)
+        return len(new_records)
+    
+    def batch_process(self, image_folder: str, literature_source: str = "", panels: bool = False):
+        """
+        Process all images in folder. Continues on errors.
+        panels=True splits each image into panels first (see add_figure_panels).
+        """
+        self._check_writable()
         image_extensions = ['.jpg', '.jpeg', '.png', '.gif', '.webp']
         image_files = []
         
@@ -175,7 +370,10 @@ Be precise with m/z values and metabolite names."""
         
         for image_path in image_files:
             try:
-                self.add_image(str(image_path), literature_source)
+                if panels:
+                    self.add_figure_panels(str(image_path), literature_source)
+                else:
+                    self.add_image(str(image_path), literature_source)
             except Exception as e:
                 print(f"Error processing {image_path}: {e}")
                 continue
@@ -184,59 +382,148 @@ Be precise with m/z values and metabolite names."""
     
     def save(self):
         """Save database to CSV file."""
+        self._check_writable()
         self.df.to_csv(self.csv_path, index=False)
         print(f"Database saved to {self.csv_path} ({len(self.df)} total entries)")
     
-    def search_by_mz(self, mz_value: str, tolerance: float = 0.5) -> pd.DataFrame:
-        """Search by m/z value with tolerance (default ±0.5 Da)."""
+    def save_shards(self, shard_dir: str, worker_id: Optional[str] = None) -> List[str]:
+        """
+        Save database as m/z-sorted shard CSVs for shard_merge.merge_shards().
+        Writes one file for this worker if worker_id is given, otherwise one
+        file per literature source, prefixed with host name and process id.
+        Returns list of shard paths.
+        """
+        shard_path = Path(shard_dir)
+        shard_path.mkdir(parents=True, exist_ok=True)
+        
+        df = self.df
+        sorted_df = df.iloc[mz_sort_order(df['mz_value'].reset_index(drop=True))]
+        
+        if worker_id is not None:
+            groups = [(f"worker-{worker_id}", sorted_df)]
+        else:
+            # Host and process in the name so workers sharing a source and a
+            # shard directory do not overwrite each other's shards
+            prefix = f"{socket.gethostname()}-{os.getpid()}"
+            groups = (
+                (f"{prefix}-{name}", shard_df) for name, shard_df in sorted_df.groupby(
+                    sorted_df['literature_source'].map(shard_name), sort=True
+                )
+            )
+        
+        saved = []
+        for name, shard_df in groups:
+            output_file = shard_path / f"{name}.csv"
+            shard_df.to_csv(output_file, index=False)
+            saved.append(str(output_file))
+            print(f"Shard saved to {output_file} ({len(shard_df)} entries)")
+        return saved
+    
+    def export_snapshot(self, snapshot_path: str) -> int:
+        """
+        Export an immutable, memory-mapped snapshot for search-only use.
+        Open it with snapshot.MALDISnapshot. Returns number of rows written.
+        """
+        from snapshot import write_snapshot
+        return write_snapshot(self.df, snapshot_path)
+    
+    def search_by_mz(self, mz_value: str, tolerance: float = 0.5,
+                     columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        Search by m/z value with tolerance (default ±0.5 Da).
+        columns limits the result (and, read-only, what is loaded) to those columns.
+        """
         try:
             mz_float = float(mz_value)
-            self.df['mz_numeric'] = pd.to_numeric(self.df['mz_value'], errors='coerce')
-            results = self.df[
-                (self.df['mz_numeric'] >= mz_float - tolerance) & 
-                (self.df['mz_numeric'] <= mz_float + tolerance)
-            ]
-            return results.drop('mz_numeric', axis=1)
         except ValueError:
-            return self.df[self.df['mz_value'].str.contains(mz_value, case=False, na=False)]
+            table = self._columns(['mz_value'] + (columns or self._all_columns))
+            return self._project(table[table['mz_value'].astype(str).str.contains(
+                mz_value, case=False, na=False
+            )], columns)
+        
+        table = self._columns(columns or self._all_columns)
+        if not np.isfinite(mz_float):
+            return self._project(table.iloc[0:0], columns)
+        order, sorted_mz = self._sorted_mz()
+        lo = np.searchsorted(sorted_mz, mz_float - tolerance, side='left')
+        hi = np.searchsorted(sorted_mz, mz_float + tolerance, side='right')
+        return self._project(table.iloc[np.sort(order[lo:hi])], columns)
     
-    def search_by_metabolite(self, metabolite_name: str) -> pd.DataFrame:
+    def _sorted_mz(self):
+        """
+        (row order, sorted numeric m/z) for the current table, cached until it changes.
+        Non-numeric rows sort last and are left out of sorted m/z, so searchsorted
+        never lands on NaN.
+        """
+        table = self._columns(['mz_value'])
+        cached_table, order, sorted_mz = getattr(self, '_mz_sort_cache', (None, None, None))
+        if cached_table is not table or len(order) != len(table):
+            mz = pd.to_numeric(table['mz_value'], errors='coerce').to_numpy(dtype=float)
+            order = np.argsort(mz, kind='stable')  # NaN sorts last
+            sorted_mz = mz[order][:np.count_nonzero(~np.isnan(mz))]
+            self._mz_sort_cache = (table, order, sorted_mz)
+        return order, sorted_mz
+    
+    def match_peaks(self, mz_values: List[float], tolerance: float = 0.5,
+                    columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        Match many observed peaks in one pass (binary search per peak).
+        Returns matching rows with the peak they matched in a 'query_mz' column.
+        """
+        order, sorted_mz = self._sorted_mz()
+        queries = np.asarray(mz_values, dtype=float)
+        lo = np.searchsorted(sorted_mz, queries - tolerance, side='left')
+        hi = np.searchsorted(sorted_mz, queries + tolerance, side='right')
+        hi[~np.isfinite(queries)] = lo[~np.isfinite(queries)]  # NaN/inf peaks match nothing
+        
+        rows = np.concatenate([order[a:b] for a, b in zip(lo, hi)] or [np.array([], dtype=int)])
+        table = self._columns(columns or self._all_columns)
+        results = self._project(table.iloc[rows], columns).copy()
+        results.insert(0, 'query_mz', np.repeat(queries, hi - lo))
+        return results
+    
+    def search_by_metabolite(self, metabolite_name: str,
+                             columns: Optional[List[str]] = None) -> pd.DataFrame:
         """Search by metabolite name (case-insensitive substring match)."""
-        return self.df[self.df['metabolite_name'].str.contains(
+        table = self._columns(['metabolite_name'] + (columns or self._all_columns))
+        return self._project(table[table['metabolite_name'].str.contains(
             metabolite_name, case=False, na=False
-        )]
+        )], columns)
     
-    def search_by_literature(self, source: str) -> pd.DataFrame:
+    def search_by_literature(self, source: str,
+                             columns: Optional[List[str]] = None) -> pd.DataFrame:
         """Search by literature source."""
-        return self.df[self.df['literature_source'].str.contains(
+        table = self._columns(['literature_source'] + (columns or self._all_columns))
+        return self._project(table[table['literature_source'].str.contains(
             source, case=False, na=False
-        )]
+        )], columns)
     
     def get_statistics(self) -> Dict:
-        """Get database summary statistics."""
-        stats = {
-            'total_entries': len(self.df),
-            'unique_metabolites': self.df['metabolite_name'].nunique(),
-            'unique_images': self.df['image_filename'].nunique(),
-            'tissue_types': self.df['tissue_type'].value_counts().to_dict()
-        }
-        return stats
+        """Get database summary statistics (maintained incrementally, no table scan)."""
+        return self.stats.summary()
     
     def export_metabolite_list(self, output_file: str = "metabolite_list.txt"):
         """Export unique metabolite list to text file."""
-        unique_metabolites = self.df['metabolite_name'].unique()
+        unique_metabolites = self.stats.sorted_metabolites
         with open(output_file, 'w') as f:
-            for metabolite in sorted(unique_metabolites):
-                f.write(f"{metabolite}\n")
+            f.writelines(f"{metabolite}\n" for metabolite in unique_metabolites)
         print(f"Exported {len(unique_metabolites)} unique metabolites to {output_file}")
     
     def remove_duplicates(self):
-        """Remove duplicate entries based on image, m/z, and metabolite."""
+        """
+        Remove duplicate entries already stored in the table (e.g. CSVs written
+        before insert-time dedup). New records are deduplicated by add_records.
+        """
+        self._check_writable()
         original_count = len(self.df)
-        self.df = self.df.drop_duplicates(
-            subset=['image_filename', 'mz_value', 'metabolite_name'],
-            keep='first'
-        )
+        self.dedup_index.clear()
+        records = self.df.to_dict('records')
+        keep = [self.dedup_index.add(record) for record in records]
+        if self._stats is not None:
+            for record, kept in zip(records, keep):
+                if not kept:
+                    self._stats.remove(record)
+        self._set_frame(self.df.loc[keep].reset_index(drop=True))
         removed_count = original_count - len(self.df)
         print(f"Removed {removed_count} duplicate entries")
 
@@ -0,0 +1,86 @@
+"""
+Running statistics for a MALDI database
+
+Counters are updated as records are inserted or removed, so summary
+statistics and the sorted metabolite list are available without scanning the
+table. Built once from an existing table with one value_counts per column.
+
+Dependencies: none (standard library only; from_frame takes a pandas DataFrame)
+"""
+
+import bisect
+from collections import Counter
+from typing import Dict, List
+
+
+def _is_missing(value) -> bool:
+    # NaN != NaN; pandas nunique/value_counts skip missing values too
+    return value is None or value != value
+
+
+class DatabaseStats:
+    """Incrementally maintained aggregates over database records."""
+
+    def __init__(self):
+        self.total_entries = 0
+        self.metabolites = Counter()
+        self.images = Counter()
+        self.tissue_types = Counter()
+        self.literature_sources = Counter()
+        self._sorted_metabolites: List = []
+
+    def _fields(self, record: Dict):
+        return ((self.metabolites, record.get('metabolite_name')),
+                (self.images, record.get('image_filename')),
+                (self.tissue_types, record.get('tissue_type')),
+                (self.literature_sources, record.get('literature_source')))
+
+    @classmethod
+    def from_frame(cls, df) -> "DatabaseStats":
+        """Build from a table with the database columns."""
+        stats = cls()
+        stats.total_entries = len(df)
+        for counter, column in ((stats.metabolites, 'metabolite_name'),
+                                (stats.images, 'image_filename'),
+                                (stats.tissue_types, 'tissue_type'),
+                                (stats.literature_sources, 'literature_source')):
+            if column in df.columns:
+                counter.update(df[column].value_counts().to_dict())
+        stats._sorted_metabolites = sorted(stats.metabolites)
+        return stats
+
+    def add(self, record: Dict):
+        self.total_entries += 1
+        for counter, value in self._fields(record):
+            if _is_missing(value):
+                continue
+            counter[value] += 1
+            if counter is self.metabolites and counter[value] == 1:
+                bisect.insort(self._sorted_metabolites, value)
+
+    def remove(self, record: Dict):
+        self.total_entries -= 1
+        for counter, value in self._fields(record):
+            if _is_missing(value) or value not in counter:
+                continue
+            counter[value] -= 1
+            if counter[value] == 0:
+                del counter[value]
+                if counter is self.metabolites:
+                    i = bisect.bisect_left(self._sorted_metabolites, value)
+                    del self._sorted_metabolites[i]
+
+    @property
+    def sorted_metabolites(self) -> List:
+        """Unique metabolite names in sorted order (do not modify)."""
+        return self._sorted_metabolites
+
+    def summary(self) -> Dict:
+        """Statistics in the MALDIDatabase.get_statistics() format."""
+        return {
+            'total_entries': self.total_entries,
+            'unique_metabolites': len(self.metabolites),
+            'unique_images': len(self.images),
+            'tissue_types': dict(self.tissue_types.most_common()),
+            'literature_sources': dict(self.literature_sources.most_common()),
+        }
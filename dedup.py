@@ -0,0 +1,126 @@
+"""
+Duplicate detection for MALDI annotation records.
+
+Keys are computed once per record and checked on insert, so duplicates never
+enter the database. Two modes:
+  - exact: (image, canonical m/z, metabolite) - "885.5" and "885.50" collide
+  - near-duplicate: same figure + normalised metabolite name with m/z inside
+    a tolerance; embedded and full-page copies of a figure count as one figure
+
+Dependencies: none (standard library only)
+"""
+
+import bisect
+import math
+import re
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+
+# Suffixes added by MALDIFigureExtractor to the two copies of one PDF page
+_COPY_SUFFIX = re.compile(r"_(embedded|full)$", re.IGNORECASE)
+_NON_ALNUM = re.compile(r"[^0-9a-z]+")
+
+
+def parse_mz(mz_value) -> Optional[float]:
+    """Return m/z as float, or None if it is missing or not numeric."""
+    try:
+        mz = float(str(mz_value).strip())
+    except (TypeError, ValueError):
+        return None
+    return None if math.isnan(mz) else mz
+
+
+def canonical_mz(mz_value) -> str:
+    """Canonical m/z string: numeric values formatted without trailing zeros."""
+    mz = parse_mz(mz_value)
+    if mz is None:
+        return str(mz_value).strip().lower()
+    return repr(mz)
+
+
+def normalize_name(name) -> str:
+    """Lowercase metabolite name with punctuation and whitespace removed."""
+    return _NON_ALNUM.sub("", str(name).lower())
+
+
+def figure_key(image_filename) -> str:
+    """Identify the source figure, merging embedded and full-page copies."""
+    stem = Path(str(image_filename)).stem
+    return _COPY_SUFFIX.sub("", stem).lower()
+
+
+def exact_key(record: Dict) -> Tuple[str, str, str]:
+    """Exact-mode key for a record dict."""
+    return (
+        str(record.get('image_filename', '')),
+        canonical_mz(record.get('mz_value', '')),
+        str(record.get('metabolite_name', '')).strip(),
+    )
+
+
+class DedupIndex:
+    """
+    Hash index of records already in the database.
+
+    Args:
+        mz_tolerance: If set, also reject near-duplicates - records from the
+            same figure with the same normalised metabolite name whose m/z is
+            within this tolerance (Da) of an indexed record.
+    """
+
+    def __init__(self, mz_tolerance: Optional[float] = None):
+        self.mz_tolerance = mz_tolerance
+        self._exact = set()
+        # (figure, normalised name) -> sorted list of m/z values
+        self._near: Dict[Tuple[str, str], List[float]] = {}
+
+    def __len__(self) -> int:
+        return len(self._exact)
+
+    def _near_parts(self, record: Dict) -> Tuple[Tuple[str, str], Optional[float]]:
+        group = (figure_key(record.get('image_filename', '')),
+                 normalize_name(record.get('metabolite_name', '')))
+        return group, parse_mz(record.get('mz_value', ''))
+
+    def contains(self, record: Dict) -> bool:
+        """True if record duplicates an indexed one."""
+        if exact_key(record) in self._exact:
+            return True
+        if self.mz_tolerance is None:
+            return False
+
+        group, mz = self._near_parts(record)
+        values = self._near.get(group)
+        if mz is None or not values:
+            return False
+        i = bisect.bisect_left(values, mz - self.mz_tolerance)
+        return i < len(values) and values[i] <= mz + self.mz_tolerance
+
+    def add(self, record: Dict) -> bool:
+        """Index record. Returns False (and indexes nothing) if it is a duplicate."""
+        if self.contains(record):
+            return False
+        self._exact.add(exact_key(record))
+        if self.mz_tolerance is not None:
+            group, mz = self._near_parts(record)
+            if mz is not None:
+                bisect.insort(self._near.setdefault(group, []), mz)
+        return True
+
+    def discard(self, record: Dict):
+        """Remove record from the index (used when rows are deleted)."""
+        self._exact.discard(exact_key(record))
+        if self.mz_tolerance is not None:
+            group, mz = self._near_parts(record)
+            values = self._near.get(group)
+            if mz is not None and values:
+                i = bisect.bisect_left(values, mz)
+                if i < len(values) and values[i] == mz:
+                    values.pop(i)
+                if not values:
+                    del self._near[group]
+
+    def clear(self):
+        self._exact.clear()
+        self._near.clear()
@@ -0,0 +1,186 @@
+"""
+Differential statistics for two replicate groups
+
+Computes group means, fold change, t-test p-values and Benjamini-Hochberg
+adjusted p-values for every feature at once with array operations, giving
+the columns plot_volcano expects (FC, Log2FC, pval, minuslog10(pval)).
+FC is mean(group A) / mean(group B). Missing replicate values are ignored.
+
+Large tables are processed in chunks: a first pass reads only the replicate
+columns to collect p-values (BH needs all of them), a second pass writes
+each chunk with its statistics appended.
+
+    python diffstats.py raw.csv stats.csv --group-a "Obp44a-/-_*" --group-b "WT_*" \
+        --label-a 7A --label-b CS
+
+Dependencies: numpy, pandas, scipy
+"""
+
+import fnmatch
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+from scipy.special import stdtr
+
+
+STAT_COLUMNS = ["FC", "Log2FC", "pval", "minuslog10(pval)", "padj"]
+
+
+def _moments(values):
+    """Per-row count, mean and sample variance, ignoring NaN."""
+    values = np.asarray(values, dtype=float)
+    missing = np.isnan(values)
+    if not missing.any():
+        n = np.full(len(values), float(values.shape[1]))
+        return n, values.mean(axis=1), values.var(axis=1, ddof=1)
+    n = (~missing).sum(axis=1).astype(float)
+    mean = np.nansum(values, axis=1) / n
+    var = np.nansum((values - mean[:, None]) ** 2, axis=1) / (n - 1)
+    return n, mean, var
+
+
+def ttest(a: np.ndarray, b: np.ndarray, equal_var: bool = True) -> Dict[str, np.ndarray]:
+    """
+    Row-wise two-sample t-test of a (features x replicates) against b.
+
+    equal_var=True is Student's test (pooled variance), False is Welch's.
+    Returns mean_a, mean_b, t, df and two-sided pval arrays; rows with fewer
+    than two values in a group get NaN.
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        n_a, mean_a, var_a = _moments(a)
+        n_b, mean_b, var_b = _moments(b)
+
+        if equal_var:
+            df = n_a + n_b - 2
+            pooled = ((n_a - 1) * var_a + (n_b - 1) * var_b) / df
+            se = np.sqrt(pooled * (1 / n_a + 1 / n_b))
+        else:
+            se_a, se_b = var_a / n_a, var_b / n_b
+            se = np.sqrt(se_a + se_b)
+            df = (se_a + se_b) ** 2 / (se_a ** 2 / (n_a - 1) + se_b ** 2 / (n_b - 1))
+
+        t = (mean_a - mean_b) / se
+        pval = 2 * stdtr(df, -np.abs(t))
+
+    too_few = (n_a < 2) | (n_b < 2)
+    t[too_few] = df[too_few] = pval[too_few] = np.nan
+    return {"mean_a": mean_a, "mean_b": mean_b, "t": t, "df": df, "pval": pval}
+
+
+def bh_adjust(pvalues: Iterable[float]) -> np.ndarray:
+    """Benjamini-Hochberg adjusted p-values (NaN stays NaN and is not counted)."""
+    p = np.asarray(pvalues, dtype=float)
+    adjusted = np.full(p.shape, np.nan)
+    finite = np.flatnonzero(~np.isnan(p))
+    if len(finite) == 0:
+        return adjusted
+
+    order = finite[np.argsort(p[finite], kind="mergesort")]
+    ranked = p[order] * len(order) / np.arange(1, len(order) + 1)
+    # Enforce monotonicity from the largest p-value down
+    ranked = np.minimum.accumulate(ranked[::-1])[::-1]
+    adjusted[order] = np.minimum(ranked, 1.0)
+    return adjusted
+
+
+def fold_change(mean_a: np.ndarray, mean_b: np.ndarray) -> Dict[str, np.ndarray]:
+    with np.errstate(divide="ignore", invalid="ignore"):
+        fc = mean_a / mean_b
+        return {"FC": fc, "Log2FC": np.log2(fc)}
+
+
+def select_columns(columns: List[str], patterns: Iterable[str]) -> List[str]:
+    """Columns matching any of the names or glob patterns, in table order."""
+    # A single pattern (e.g. "group_a": "WT_*" in a JSON config) is not split into characters
+    patterns = [patterns] if isinstance(patterns, str) else list(patterns)
+    selected = [c for c in columns if any(c == p or fnmatch.fnmatchcase(c, p) for p in patterns)]
+    if not selected:
+        raise ValueError(f"No columns match {patterns}")
+    return selected
+
+
+def differential_table(df: pd.DataFrame, group_a: Iterable[str], group_b: Iterable[str],
+                       label_a: str = "A", label_b: str = "B", equal_var: bool = True,
+                       padj: Optional[np.ndarray] = None) -> pd.DataFrame:
+    """
+    Copy of df with '<label> Avg' columns and the statistics columns appended.
+
+    group_a/group_b are replicate column names or glob patterns. padj can be
+    given when the table is one chunk of a larger one (see differential_csv);
+    otherwise it is computed over this table.
+    """
+    columns = [str(c) for c in df.columns]
+    a_cols = select_columns(columns, group_a)
+    b_cols = select_columns(columns, group_b)
+    a = df[a_cols].apply(pd.to_numeric, errors="coerce").to_numpy(dtype=float)
+    b = df[b_cols].apply(pd.to_numeric, errors="coerce").to_numpy(dtype=float)
+
+    stats = ttest(a, b, equal_var)
+    result = df.copy()
+    result[f"{label_a} Avg"] = stats["mean_a"]
+    result[f"{label_b} Avg"] = stats["mean_b"]
+    for column, values in fold_change(stats["mean_a"], stats["mean_b"]).items():
+        result[column] = values
+    result["pval"] = stats["pval"]
+    with np.errstate(divide="ignore"):
+        result["minuslog10(pval)"] = -np.log10(stats["pval"])
+    result["padj"] = bh_adjust(stats["pval"]) if padj is None else padj
+    return result
+
+
+def differential_csv(input_csv: str, output_csv: str, group_a: Iterable[str],
+                     group_b: Iterable[str], label_a: str = "A", label_b: str = "B",
+                     equal_var: bool = True, chunksize: int = 100_000) -> int:
+    """
+    Compute differential statistics for a CSV of any size, chunk by chunk.
+    Returns number of features written.
+    """
+    # utf-8-sig: spreadsheet exports often start with a byte order mark
+    columns = list(pd.read_csv(input_csv, nrows=0, encoding="utf-8-sig").columns)
+    a_cols = select_columns(columns, group_a)
+    b_cols = select_columns(columns, group_b)
+
+    # Pass 1: p-values only, for the global BH adjustment
+    pvalues = []
+    for chunk in pd.read_csv(input_csv, usecols=a_cols + b_cols, chunksize=chunksize,
+                             encoding="utf-8-sig"):
+        a = chunk[a_cols].apply(pd.to_numeric, errors="coerce").to_numpy(dtype=float)
+        b = chunk[b_cols].apply(pd.to_numeric, errors="coerce").to_numpy(dtype=float)
+        pvalues.append(ttest(a, b, equal_var)["pval"])
+    padj = bh_adjust(np.concatenate(pvalues) if pvalues else [])
+
+    # Pass 2: full rows with statistics
+    written = 0
+    for chunk in pd.read_csv(input_csv, chunksize=chunksize, encoding="utf-8-sig"):
+        table = differential_table(chunk, a_cols, b_cols, label_a, label_b, equal_var,
+                                   padj=padj[written:written + len(chunk)])
+        table.to_csv(output_csv, mode="w" if written == 0 else "a", header=written == 0,
+                     index=False)
+        written += len(chunk)
+
+    print(f"Differential statistics for {written} features saved to {output_csv}")
+    return written
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Fold changes and t-tests between two replicate groups")
+    parser.add_argument("input_csv")
+    parser.add_argument("output_csv")
+    parser.add_argument("--group-a", nargs="+", required=True,
+                        help="Replicate columns of group A (names or glob patterns)")
+    parser.add_argument("--group-b", nargs="+", required=True,
+                        help="Replicate columns of group B (names or glob patterns)")
+    parser.add_argument("--label-a", default="A")
+    parser.add_argument("--label-b", default="B")
+    parser.add_argument("--welch", action="store_true",
+                        help="Welch's t-test (default: Student's, pooled variance)")
+    parser.add_argument("--chunksize", type=int, default=100_000)
+    args = parser.parse_args()
+
+    differential_csv(args.input_csv, args.output_csv, args.group_a, args.group_b,
+                     args.label_a, args.label_b, equal_var=not args.welch,
+                     chunksize=args.chunksize)
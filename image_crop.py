@@ -1,38 +1,52 @@
+import csv
+import math
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from contextlib import contextmanager
+
 import numpy as np
 from PIL import Image
 import cv2
 from pathlib import Path
 
-def auto_crop_maldi(image_path, output_path=None, padding=10):
-    """
-    Automatically crop MALDI image to tissue boundaries.
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.tif', '.tiff'}
+
+# Bytes per pixel of uncompressed raw layouts that can be decoded row range by row range
+_RAW_BYTES_PER_PIXEL = {'L': 1, 'P': 1, 'LA': 2, 'RGB': 3, 'RGBA': 4, 'RGBX': 4, 'CMYK': 4,
+                        'I;16': 2, 'I;16B': 2, 'I;16L': 2, 'I;32': 4, 'I;32B': 4,
+                        'F;32F': 4, 'F;32BF': 4}
+
+
+def tissue_mask(gray):
+    """Binary tissue mask of a grayscale image (Otsu threshold + morphology)."""
+    # Automatic thresholding
+    _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
     
-    Args:
-        image_path: Path to input image
-        output_path: Path to save cropped image (optional)
-        padding: Extra pixels around tissue (default: 10)
+    # Clean up noise
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))
+    binary = cv2.morphologyEx(binary, cv2.MORPH_CLOSE, kernel)
+    binary = cv2.morphologyEx(binary, cv2.MORPH_OPEN, kernel)
+    return binary
+
+
+def crop_box(img_array, padding=10):
+    """
+    Tissue bounding box of an image array, with padding.
     
     Returns:
-        Cropped PIL Image
+        (x, y, w, h) in pixels
     """
-    # Load image
-    img = Image.open(image_path)
-    img_array = np.array(img)
-    
     # Convert to grayscale
     if len(img_array.shape) == 3:
         gray = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
     else:
         gray = img_array
     
-    # Automatic thresholding
-    _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-    
-    # Clean up noise
-    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))
-    binary = cv2.morphologyEx(binary, cv2.MORPH_CLOSE, kernel)
-    binary = cv2.morphologyEx(binary, cv2.MORPH_OPEN, kernel)
-    
+    return _padded_box(tissue_mask(gray), padding)
+
+
+def _padded_box(binary, padding):
     # Find bounding box
     coords = cv2.findNonZero(binary)
     x, y, w, h = cv2.boundingRect(coords)
@@ -40,11 +54,283 @@ def auto_crop_maldi(image_path, output_path=None, padding=10):
     # Add padding
     x = max(0, x - padding)
     y = max(0, y - padding)
-    w = min(img_array.shape[1] - x, w + 2*padding)
-    h = min(img_array.shape[0] - y, h + 2*padding)
+    w = min(binary.shape[1] - x, w + 2*padding)
+    h = min(binary.shape[0] - y, h + 2*padding)
+    return x, y, w, h
+
+
+def auto_crop_maldi_buffer(image, padding=10, output_format='.png'):
+    """
+    In-memory auto_crop_maldi for pipelines: no files, minimal pixel copies.
+    
+    Args:
+        image: Encoded image bytes (decoded with cv2.imdecode) or an array
+            in OpenCV channel order (BGR/BGRA/grayscale)
+        padding: Extra pixels around tissue (default: 10)
+        output_format: Encode the crop with cv2.imencode, e.g. '.png' or '.jpg';
+            None returns the crop as an array view into the decoded image
+    
+    Returns:
+        ((x, y, w, h), encoded bytes or array view)
+    """
+    img_array, gray = _decode_buffer(image)
+    x, y, w, h = _padded_box(tissue_mask(gray), padding)
+    return (x, y, w, h), _encode_view(img_array[y:y+h, x:x+w], output_format)
+
+
+def _decode_buffer(image):
+    """(image array in OpenCV channel order, grayscale array) from bytes or an array."""
+    if isinstance(image, np.ndarray):
+        img_array = image
+    else:
+        # frombuffer wraps the bytes without copying; imdecode reads them directly
+        img_array = cv2.imdecode(np.frombuffer(image, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+        if img_array is None:
+            raise ValueError("Could not decode image data")
+    
+    if img_array.ndim == 2:
+        gray = img_array
+    elif img_array.shape[2] == 4:
+        gray = cv2.cvtColor(img_array, cv2.COLOR_BGRA2GRAY)
+    else:
+        gray = cv2.cvtColor(img_array, cv2.COLOR_BGR2GRAY)
+    return img_array, gray
+
+
+def _encode_view(view, output_format):
+    if output_format is None:
+        return view
+    ok, encoded = cv2.imencode(output_format, view)
+    if not ok:
+        raise ValueError(f"Could not encode crop as {output_format}")
+    return encoded.tobytes()
+
+
+def _label_extent(ink_rows, max_rows, gap):
+    """Rows of a label strip next to a panel, from the row profile walking away from it."""
+    extent = blank = 0
+    for i, has_ink in enumerate(ink_rows[:max_rows]):
+        if has_ink:
+            extent, blank = i + 1, 0
+        else:
+            blank += 1
+            # Labels may sit some way off the panel, but are compact once started
+            if extent and blank > gap:
+                break
+    return extent
+
+
+def segment_panels(image, padding=4, min_area_frac=0.002, label_max_frac=0.35,
+                   output_format='.png'):
+    """
+    Split a multi-panel MALDI figure into individual ion-image tiles.
+    
+    Panels are connected components of the tissue mask used by auto_crop_maldi
+    (dilated so fragments of one tissue section stay together). Each panel is
+    extended up/down over its label strip (m/z text) using row projection
+    profiles of pixels that differ from the background.
+    
+    Args:
+        image: Encoded image bytes or array, as for auto_crop_maldi_buffer
+        padding: Extra pixels around each tile (default: 4)
+        min_area_frac: Ignore components smaller than this fraction of the figure
+        label_max_frac: Longest label strip, as a fraction of the panel height
+        output_format: Tile encoding ('.png', '.jpg'...) or None for array views
+    
+    Returns:
+        List of dicts in reading order: index, box (x, y, w, h) of the tile,
+        panel_box (image only), tile (encoded bytes or array view)
+    """
+    img_array, gray = _decode_buffer(image)
+    H, W = gray.shape
+    
+    # Polarity: background is whatever dominates the figure border
+    border = np.concatenate([gray[0], gray[-1], gray[:, 0], gray[:, -1]])
+    background = int(np.median(border))
+    mask = tissue_mask(gray)
+    if np.median(np.concatenate([mask[0], mask[-1], mask[:, 0], mask[:, -1]])) > 0:
+        mask = cv2.bitwise_not(mask)
+    ink = cv2.absdiff(gray, np.full_like(gray, background)) > 40
+    
+    merge = max(3, min(H, W) // 100) | 1
+    mask = cv2.dilate(mask, cv2.getStructuringElement(cv2.MORPH_RECT, (merge, merge)))
+    n, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+    boxes = [tuple(int(v) for v in stats[i, :4]) for i in range(1, n)
+             if stats[i, cv2.CC_STAT_AREA] >= min_area_frac * H * W]
+    
+    panels = []
+    for x, y, w, h in boxes:
+        # Rows above/below until the next panel in the same columns
+        below_limit = min([by for bx, by, bw, bh in boxes
+                           if by >= y + h and bx < x + w and bx + bw > x] + [H])
+        above_limit = max([by + bh for bx, by, bw, bh in boxes
+                           if by + bh <= y and bx < x + w and bx + bw > x] + [0])
+        max_rows = int(label_max_frac * h)
+        gap = max(3, h // 20)
+        below = _label_extent(ink[y + h:below_limit, x:x + w].any(axis=1), max_rows, gap)
+        above = _label_extent(ink[above_limit:y, x:x + w].any(axis=1)[::-1], max_rows, gap)
+        
+        x0, y0 = max(0, x - padding), max(0, y - above - padding)
+        x1, y1 = min(W, x + w + padding), min(H, y + h + below + padding)
+        panels.append({'box': (x0, y0, x1 - x0, y1 - y0), 'panel_box': (x, y, w, h)})
+    
+    # Reading order: rows of panels top to bottom, then left to right
+    row_height = max(1, int(np.median([p['panel_box'][3] for p in panels])) // 2) if panels else 1
+    panels.sort(key=lambda p: (p['panel_box'][1] // row_height, p['panel_box'][0]))
+    for index, panel in enumerate(panels):
+        x, y, w, h = panel['box']
+        panel['index'] = index
+        panel['tile'] = _encode_view(img_array[y:y+h, x:x+w], output_format)
+    return panels
+
+
+@contextmanager
+def _allow_large_images():
+    """Lift PIL's decompression-bomb limit for deliberately huge slide scans."""
+    limit = Image.MAX_IMAGE_PIXELS
+    Image.MAX_IMAGE_PIXELS = None
+    try:
+        yield
+    finally:
+        Image.MAX_IMAGE_PIXELS = limit
+
+
+def _region_tiles(img, box):
+    """
+    Decoder tiles of img restricted to the rows of box, or None if the
+    encoding can only be decoded whole (compressed/libtiff, JPEG, PNG...).
+    """
+    if getattr(img, 'use_load_libtiff', False) or not img.tile:
+        return None
+    x0, y0, x1, y1 = box
+    tiles = []
+    for codec, (tx0, ty0, tx1, ty1), offset, args in img.tile:
+        if codec != 'raw' or len(args) < 3 or args[2] != 1 or args[0] not in _RAW_BYTES_PER_PIXEL:
+            return None
+        if tx1 <= x0 or tx0 >= x1 or ty1 <= y0 or ty0 >= y1:
+            continue
+        stride = args[1] or (tx1 - tx0) * _RAW_BYTES_PER_PIXEL[args[0]]
+        r0, r1 = max(ty0, y0), min(ty1, y1)
+        tiles.append((codec, (tx0, r0, tx1, r1), offset + (r0 - ty0) * stride,
+                      (args[0], stride, 1)))
+    return tiles
+
+
+def read_region(image_path, box, frame=0):
+    """
+    Read box (x0, y0, x1, y1) of an image at full resolution.
+    Uncompressed TIFF strips/tiles are decoded only where they overlap the box,
+    so memory is bounded by the region; other encodings are decoded whole.
+    """
+    img = Image.open(image_path)
+    img.seek(frame)
+    tiles = _region_tiles(img, box)
+    if not tiles:
+        return img.crop(box)
+    
+    # Decode only the tile-aligned band around the box into a smaller image
+    ux0 = min(t[1][0] for t in tiles)
+    ux1 = max(t[1][2] for t in tiles)
+    img.tile = [(codec, (tx0 - ux0, ty0 - box[1], tx1 - ux0, ty1 - box[1]), offset, args)
+                for codec, (tx0, ty0, tx1, ty1), offset, args in tiles]
+    img._size = (ux1 - ux0, box[3] - box[1])
+    img.load()
+    return img.crop((box[0] - ux0, 0, box[2] - ux0, box[3] - box[1]))
+
+
+def _pyramid_level(img, proxy_size):
+    """Smallest pyramid level (TIFF page) with the full image's aspect ratio and long side >= proxy_size."""
+    full_w, full_h = img.size
+    best, best_side = 0, max(img.size)
+    for frame in range(1, getattr(img, 'n_frames', 1)):
+        img.seek(frame)
+        w, h = img.size
+        same_aspect = abs(w * full_h - h * full_w) <= 0.01 * full_w * full_h
+        if same_aspect and proxy_size <= max(w, h) < best_side:
+            best, best_side = frame, max(w, h)
+    img.seek(0)
+    return best
+
+
+def _proxy_gray(image_path, proxy_size):
+    """Grayscale proxy with long side about proxy_size, read at reduced resolution where possible."""
+    img = Image.open(image_path)
+    frame = _pyramid_level(img, proxy_size)
+    img.seek(frame)
+    level_w, level_h = img.size
+    factor = max(1, max(level_w, level_h) // proxy_size)
+    if factor == 1:
+        return np.asarray(img.convert('L'))
+    
+    tiles = _region_tiles(img, (0, 0, level_w, level_h))
+    if tiles:
+        # Raw layout: stream full-resolution row bands (~16 MB each) and shrink each one
+        band_rows = max(factor, (1 << 24) // (level_w * 4) // factor * factor)
+        bands = [
+            np.asarray(read_region(image_path, (0, y, level_w, min(level_h, y + band_rows)), frame)
+                       .convert('L').reduce(factor))
+            for y in range(0, level_h, band_rows)
+        ]
+        return np.vstack(bands)
+    
+    # JPEG decodes directly at 1/2, 1/4 or 1/8 scale; other formats decode whole
+    img.draft('L', (level_w // factor, level_h // factor))
+    gray = img.convert('L')
+    factor = max(1, max(gray.size) // proxy_size)
+    return np.asarray(gray.reduce(factor) if factor > 1 else gray)
+
+
+def proxy_crop_box(image_path, padding=10, proxy_size=2048):
+    """
+    Tissue bounding box of a very large image, computed on a downsampled proxy
+    and mapped back to full resolution.
+    
+    Returns:
+        (x, y, w, h) in full-resolution pixels
+    """
+    with _allow_large_images():
+        full_w, full_h = Image.open(image_path).size
+        gray = _proxy_gray(image_path, proxy_size)
+    
+    coords = cv2.findNonZero(tissue_mask(gray))
+    px, py, pw, ph = cv2.boundingRect(coords)
+    scale_x = full_w / gray.shape[1]
+    scale_y = full_h / gray.shape[0]
+    
+    # Round outwards so the proxy box never loses tissue at full resolution
+    x0 = max(0, math.floor(px * scale_x) - padding)
+    y0 = max(0, math.floor(py * scale_y) - padding)
+    x1 = min(full_w, math.ceil((px + pw) * scale_x) + padding)
+    y1 = min(full_h, math.ceil((py + ph) * scale_y) + padding)
+    return x0, y0, x1 - x0, y1 - y0
+
+
+def auto_crop_maldi(image_path, output_path=None, padding=10, proxy_size=None):
+    """
+    Automatically crop MALDI image to tissue boundaries.
+    
+    Args:
+        image_path: Path to input image
+        output_path: Path to save cropped image (optional)
+        padding: Extra pixels around tissue (default: 10)
+        proxy_size: For whole-slide / very large images: find the tissue on a
+            proxy with this long side (e.g. 2048) and read only the crop at
+            full resolution (default: None, process at full resolution)
     
-    # Crop
-    cropped = img.crop((x, y, x+w, y+h))
+    Returns:
+        Cropped PIL Image
+    """
+    if proxy_size:
+        x, y, w, h = proxy_crop_box(image_path, padding, proxy_size)
+        with _allow_large_images():
+            cropped = read_region(image_path, (x, y, x+w, y+h))
+    else:
+        # Load image
+        img = Image.open(image_path)
+        x, y, w, h = crop_box(np.array(img), padding)
+        
+        # Crop
+        cropped = img.crop((x, y, x+w, y+h))
     
     # Save if output path provided
     if output_path:
@@ -54,23 +340,124 @@ def auto_crop_maldi(image_path, output_path=None, padding=10):
     return cropped
 
 
-def batch_crop(input_folder, output_folder, padding=10):
-    """Process all images in a folder"""
+def _report_entry(img_file, out_file, status):
+    return {'file': str(img_file), 'output': str(out_file), 'status': status,
+            'box': None, 'load_s': 0.0, 'crop_s': 0.0, 'save_s': 0.0, 'error': ''}
+
+
+def _crop_file(img_file, out_file, padding, proxy_size=None):
+    """Crop one file for batch_crop. Returns its report entry."""
+    result = _report_entry(img_file, out_file, 'cropped')
+    try:
+        start = time.perf_counter()
+        if proxy_size:
+            # Box comes from the proxy; load time is the region read
+            x, y, w, h = proxy_crop_box(img_file, padding, proxy_size)
+            loaded = time.perf_counter()
+            with _allow_large_images():
+                cropped = read_region(img_file, (x, y, x+w, y+h))
+        else:
+            img = Image.open(img_file)
+            img_array = np.array(img)
+            loaded = time.perf_counter()
+            x, y, w, h = crop_box(img_array, padding)
+            cropped = img.crop((x, y, x+w, y+h))
+        done = time.perf_counter()
+        cropped.save(out_file)
+        result.update(box=(x, y, w, h), load_s=loaded - start, crop_s=done - loaded,
+                      save_s=time.perf_counter() - done)
+    except Exception as e:
+        result.update(status='error', error=f"{type(e).__name__}: {e}")
+    return result
+
+
+def _is_up_to_date(img_file, out_file):
+    return out_file.exists() and out_file.stat().st_mtime >= img_file.stat().st_mtime
+
+
+def batch_crop(input_folder, output_folder, padding=10, workers=None, max_in_flight=None,
+               skip_up_to_date=True, report_path=None, proxy_size=None):
+    """
+    Process all images in a folder in parallel worker processes.
+    
+    Args:
+        input_folder: Folder with images (.png, .jpg, .jpeg, .tif, .tiff, any case)
+        output_folder: Folder for cropped images (same file names)
+        padding: Extra pixels around tissue (default: 10)
+        workers: Worker processes (default: CPU count; 1 crops in this process)
+        max_in_flight: Most images queued at once (default: 2 x workers)
+        skip_up_to_date: Skip images whose output is newer than the input
+        report_path: Also write the per-file report as CSV (optional)
+        proxy_size: Proxy long side for very large images (see auto_crop_maldi)
+    
+    Returns:
+        List of per-file dicts: file, output, status (cropped/skipped/error),
+        box (x, y, w, h), load_s, crop_s, save_s, error
+    """
     input_path = Path(input_folder)
     output_path = Path(output_folder)
-    output_path.mkdir(exist_ok=True)
+    output_path.mkdir(parents=True, exist_ok=True)
+    
+    # One directory pass, matched case-insensitively, so no file is seen twice
+    image_files = sorted(f for f in input_path.iterdir()
+                         if f.is_file() and f.suffix.lower() in IMAGE_EXTENSIONS)
+    
+    results, jobs = [], []
+    for img_file in image_files:
+        out_file = output_path / img_file.name
+        if skip_up_to_date and _is_up_to_date(img_file, out_file):
+            results.append(_report_entry(img_file, out_file, 'skipped'))
+        else:
+            jobs.append((img_file, out_file))
+    
+    workers = workers or os.cpu_count() or 1
+    print(f"Cropping {len(jobs)} of {len(image_files)} images with {workers} workers...")
+    start = time.perf_counter()
     
-    # Process all common image formats
-    for ext in ['*.png', '*.jpg', '*.jpeg', '*.tif', '*.tiff']:
-        for img_file in input_path.glob(ext):
-            print(f"Processing {img_file.name}...")
-            auto_crop_maldi(img_file, output_path / img_file.name, padding=padding)
+    if workers == 1:
+        results.extend(_crop_file(img_file, out_file, padding, proxy_size) for img_file, out_file in jobs)
+    else:
+        max_in_flight = max_in_flight or 2 * workers
+        pending = set()
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for img_file, out_file in jobs:
+                # Bounded queue: wait for a slot before submitting more work
+                if len(pending) >= max_in_flight:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    results.extend(f.result() for f in done)
+                pending.add(pool.submit(_crop_file, img_file, out_file, padding, proxy_size))
+            results.extend(f.result() for f in wait(pending).done)
+    
+    results.sort(key=lambda r: r['file'])
+    counts = {status: sum(r['status'] == status for r in results)
+              for status in ('cropped', 'skipped', 'error')}
+    print(f"Cropped {counts['cropped']}, skipped {counts['skipped']} up to date, "
+          f"{counts['error']} errors in {time.perf_counter() - start:.1f}s")
+    for r in results:
+        if r['status'] == 'error':
+            print(f"  Error cropping {r['file']}: {r['error']}")
+    
+    if report_path:
+        with open(report_path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(results[0]) if results else ['file'])
+            writer.writeheader()
+            writer.writerows(results)
+    
+    return results
 
 
 # USAGE EXAMPLES:
+# (guarded so that importing this module, e.g. in batch_crop worker processes, crops nothing)
 
-# Single image
-auto_crop_maldi('input.jpeg', 'output.png')
-
-# Batch process entire folder
-# batch_crop('raw_images/', 'cropped_images/', padding=10)
\ No newline at end of file
+if __name__ == "__main__":
+    # Single image
+    auto_crop_maldi('input.jpeg', 'output.png')
+    
+    # Batch process entire folder
+    # batch_crop('raw_images/', 'cropped_images/', padding=10, workers=8)
+    
+    # Multi-panel figure -> one tile per ion image
+    # panels = segment_panels(open('figure.png', 'rb').read())
+    
+    # Whole-slide scan: find tissue on a 2048 px proxy, read only the crop
+    # auto_crop_maldi('slide.tif', 'slide_cropped.tif', proxy_size=2048)
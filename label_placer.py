@@ -0,0 +1,177 @@
+"""
+Fast label placement for scatter plots
+
+Greedy replacement for adjustText: each label tries candidate positions
+around its point, nearest first, and takes the first one that does not
+overlap an already placed label (checked through a uniform grid in display
+space) or cover a data point. Labels that cannot be placed close by get a
+leader line. Cost is roughly linear in the number of labels.
+"""
+
+import time
+from collections import defaultdict
+
+import numpy as np
+from matplotlib.font_manager import FontProperties
+
+
+# Candidate directions around a point, in order of preference (dx, dy)
+_DIRECTIONS = [(1, 1), (1, -1), (-1, 1), (-1, -1), (1, 0), (-1, 0), (0, 1), (0, -1)]
+
+
+class _BoxGrid:
+    """Uniform grid over display space holding placed label boxes and points."""
+
+    def __init__(self, cell):
+        self.cell = cell
+        self.cells = defaultdict(list)
+        self.points = defaultdict(list)
+
+    def _keys(self, box):
+        c = self.cell
+        for i in range(int(box[0] // c), int(box[2] // c) + 1):
+            for j in range(int(box[1] // c), int(box[3] // c) + 1):
+                yield i, j
+
+    def overlaps(self, box):
+        for key in self._keys(box):
+            for other in self.cells.get(key, ()):
+                if box[0] < other[2] and other[0] < box[2] and box[1] < other[3] and other[1] < box[3]:
+                    return True
+        return False
+
+    def add(self, box):
+        for key in self._keys(box):
+            self.cells[key].append(box)
+
+    def add_point(self, x, y):
+        self.points[(int(x // self.cell), int(y // self.cell))].append((x, y))
+
+    def covers_point(self, box):
+        for key in self._keys(box):
+            for x, y in self.points.get(key, ()):
+                if box[0] <= x <= box[2] and box[1] <= y <= box[3]:
+                    return True
+        return False
+
+
+def _point_cells(points, cell):
+    """Set of grid cells containing at least one point (vectorised)."""
+    if points is None or len(points) == 0:
+        return set()
+    keys = np.unique(np.floor(points / cell).astype(np.int64), axis=0)
+    return set(map(tuple, keys))
+
+
+def _covers_points(box, occupied, cell):
+    for i in range(int(box[0] // cell), int(box[2] // cell) + 1):
+        for j in range(int(box[1] // cell), int(box[3] // cell) + 1):
+            if (i, j) in occupied:
+                return True
+    return False
+
+
+def place_labels(ax, xs, ys, labels, fontsize=8, color='black', avoid_x=None, avoid_y=None,
+                 max_rings=6, time_budget=None, arrowprops=None):
+    """
+    Place text labels next to points without overlaps.
+
+    Args:
+        ax: Matplotlib axes (limits should be final before calling)
+        xs, ys: Data coordinates of the labelled points
+        labels: Label strings
+        fontsize, color: Text style
+        avoid_x, avoid_y: Further points labels should not cover when there is
+            room elsewhere (e.g. all plotted points)
+        max_rings: Candidate distances tried near the point; further ones get leader lines
+        time_budget: Seconds to spend searching; labels left when it runs out
+            are put at the default offset with a leader line
+        arrowprops: Leader line style (default thin black line)
+
+    Returns:
+        List of Text/Annotation artists
+    """
+    arrowprops = arrowprops or dict(arrowstyle="-", color='black', lw=0.5)
+    xs, ys = np.asarray(xs, dtype=float), np.asarray(ys, dtype=float)
+    labels = [str(label) for label in labels]
+    if not labels:
+        return []
+
+    fig = ax.figure
+    renderer = fig.canvas.get_renderer()
+    prop = FontProperties(size=fontsize)
+    scale = fig.dpi / 72
+    anchors = ax.transData.transform(np.column_stack([xs, ys]))
+    bounds = ax.get_window_extent(renderer)
+
+    sizes = []
+    for label in labels:
+        w, h, _ = renderer.get_text_width_height_descent(label, prop, ismath=False)
+        sizes.append((w, h))
+
+    line_height = max(h for _, h in sizes) or fontsize * scale
+    grid = _BoxGrid(2 * line_height)
+    # Labels must not cover the labelled points; other points only if unavoidable.
+    # Other points can be numerous, so they are only tracked as occupied grid cells.
+    for px, py in anchors[np.isfinite(anchors).all(axis=1)]:
+        grid.add_point(px, py)
+    cell = line_height / 2
+    other_cells = set()
+    if avoid_x is not None and avoid_y is not None:
+        others = ax.transData.transform(np.column_stack([np.asarray(avoid_x, dtype=float),
+                                                         np.asarray(avoid_y, dtype=float)]))
+        other_cells = _point_cells(others[np.isfinite(others).all(axis=1)], cell)
+
+    gap = 2 * scale
+    deadline = None if time_budget is None else time.perf_counter() + time_budget
+    inverse = ax.transData.inverted()
+    artists = []
+
+    for k in range(len(labels)):
+        (px, py), (w, h) = anchors[k], sizes[k]
+        if not np.isfinite([px, py]).all():
+            continue
+        placed, leader = None, False
+
+        if deadline is None or time.perf_counter() < deadline:
+            # Strict pass keeps clear of other points; relaxed pass reaches further out
+            for strict, rings in ((True, max_rings), (False, 3 * max_rings)):
+                for ring in range(1, rings + 1):
+                    r = gap + (ring - 1) * h
+                    for dx, dy in _DIRECTIONS:
+                        x0 = px + dx * r if dx >= 0 else px - r - w
+                        y0 = py + dy * r if dy >= 0 else py - r - h
+                        if dx == 0:
+                            x0 = px - w / 2
+                        if dy == 0:
+                            y0 = py - h / 2
+                        box = (x0, y0, x0 + w, y0 + h)
+                        if (box[0] < bounds.x0 or box[2] > bounds.x1
+                                or box[1] < bounds.y0 or box[3] > bounds.y1):
+                            continue
+                        if grid.overlaps(box) or grid.covers_point(box):
+                            continue
+                        if strict and _covers_points(box, other_cells, cell):
+                            continue
+                        placed, leader = box, ring > 2
+                        break
+                    if placed:
+                        break
+                if placed:
+                    break
+
+        if placed is None:
+            # Out of time or room: default offset with a leader line
+            placed = (px + gap + h, py + gap + h, px + gap + h + w, py + gap + h + h)
+            leader = True
+        grid.add(placed)
+
+        tx, ty = inverse.transform((placed[0], placed[1]))
+        if leader:
+            artists.append(ax.annotate(labels[k], xy=(xs[k], ys[k]), xytext=(tx, ty),
+                                       fontsize=fontsize, color=color, ha='left', va='bottom',
+                                       arrowprops=arrowprops))
+        else:
+            artists.append(ax.text(tx, ty, labels[k], fontsize=fontsize, color=color,
+                                   ha='left', va='bottom'))
+    return artists
@@ -3,12 +3,13 @@ PDF MALDI Figure Extractor
 Extracts MALDI imaging figures from scientific PDFs using Claude AI.
 """
 
-import anthropic
 import base64
 import os
 from pathlib import Path
 from typing import List, Dict, Tuple
-import fitz  # PyMuPDF
+
+# anthropic and fitz (PyMuPDF) are imported on first use, so importing this
+# module stays cheap for code that only needs part of it
 
 
 class MALDIFigureExtractor:
@@ -20,11 +21,23 @@ class MALDIFigureExtractor:
             api_key: Anthropic API key (or use ANTHROPIC_API_KEY env var)
             output_dpi: DPI for extracted images (default 300)
         """
-        self.client = anthropic.Anthropic(api_key=api_key or os.environ.get("ANTHROPIC_API_KEY"))
+        self._api_key = api_key
+        self._client = None
         self.output_dpi = output_dpi
     
+    @property
+    def client(self):
+        """Anthropic API client, created on first use."""
+        if self._client is None:
+            import anthropic
+            self._client = anthropic.Anthropic(
+                api_key=self._api_key or os.environ.get("ANTHROPIC_API_KEY")
+            )
+        return self._client
+    
     def extract_images_from_pdf(self, pdf_path: str) -> List[Tuple[int, bytes, str]]:
         """Extract all embedded images from PDF."""
+        import fitz  # PyMuPDF
         doc = fitz.open(pdf_path)
         images = []
         
@@ -44,6 +57,7 @@ class MALDIFigureExtractor:
     
     def render_pdf_pages_as_images(self, pdf_path: str) -> List[Tuple[int, bytes]]:
         """Render each PDF page as high-res image (captures vector graphics)."""
+        import fitz  # PyMuPDF
         doc = fitz.open(pdf_path)
         page_images = []
         
@@ -0,0 +1,180 @@
+"""
+Searchable points-of-interest picker for the volcano GUI
+
+NameIndex keeps the unique names sorted (case-insensitive) for prefix lookup
+by binary search, plus one joined lower-case string for substring search, so
+filtering tens of thousands of names takes milliseconds. PointsOfInterestPicker
+is a virtualised list: the Listbox only ever holds the rows on screen, and
+selections are kept in a set so they survive filtering.
+
+Dependencies: none (standard library; tkinter for the widget)
+"""
+
+import bisect
+import tkinter as tk
+from tkinter import ttk
+from typing import Iterable, List
+
+
+class NameIndex:
+    """Sorted prefix/substring index over unique names."""
+
+    def __init__(self, names: Iterable = ()):
+        unique = {}
+        for name in names:
+            # Missing values (None/NaN) cannot be points of interest
+            if name is None or name != name:
+                continue
+            unique.setdefault(name, str(name))
+        self.names = sorted(unique, key=lambda n: unique[n].lower())
+        self.keys = [unique[n].lower() for n in self.names]
+        # Names joined by a separator that cannot occur in a query
+        self._text = "\n".join(self.keys)
+        self._starts = []
+        position = 0
+        for key in self.keys:
+            self._starts.append(position)
+            position += len(key) + 1
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def prefix(self, text: str) -> range:
+        """Positions (in sorted order) of names starting with text."""
+        text = text.lower()
+        lo = bisect.bisect_left(self.keys, text)
+        hi = bisect.bisect_left(self.keys, text + "\U0010ffff", lo)
+        return range(lo, hi)
+
+    def search(self, text: str) -> List[int]:
+        """Positions of names containing text, names starting with it first."""
+        text = text.lower().replace("\n", " ")
+        if not text:
+            return list(range(len(self.names)))
+        prefixed = self.prefix(text)
+        hits, seen = list(prefixed), set(prefixed)
+        position = self._text.find(text)
+        while position != -1:
+            i = bisect.bisect_right(self._starts, position) - 1
+            if i not in seen:
+                seen.add(i)
+                hits.append(i)
+            # Next match can only be in a later name
+            position = self._text.find(text, self._starts[i] + len(self.keys[i]) + 1)
+        return hits
+
+
+class PointsOfInterestPicker(ttk.Frame):
+    """
+    Filterable multi-select list of names that only renders visible rows.
+
+    Args:
+        master: Parent widget
+        height: Number of visible rows
+        command: Called with no arguments when the selection changes
+    """
+
+    def __init__(self, master, height: int = 10, filter_delay: int = 150, command=None):
+        super().__init__(master)
+        self.height = height
+        self.command = command
+        self.filter_delay = filter_delay
+        self.index = NameIndex()
+        self.selected = set()
+        self._matches: List[int] = []
+        self._top = 0
+        self._pending = None
+
+        self.filter_text = tk.StringVar()
+        self.status = tk.StringVar()
+
+        entry = ttk.Entry(self, textvariable=self.filter_text)
+        entry.grid(row=0, column=0, columnspan=2, sticky="ew")
+        self.listbox = tk.Listbox(self, height=height, activestyle="none",
+                                  exportselection=False, selectmode=tk.MULTIPLE)
+        self.listbox.grid(row=1, column=0, sticky="nsew")
+        self.scrollbar = ttk.Scrollbar(self, orient=tk.VERTICAL, command=self._on_scrollbar)
+        self.scrollbar.grid(row=1, column=1, sticky="ns")
+        ttk.Label(self, textvariable=self.status).grid(row=2, column=0, sticky="w")
+        ttk.Button(self, text="Clear", command=self.clear_selection).grid(row=2, column=1, sticky="e")
+        self.columnconfigure(0, weight=1)
+        self.rowconfigure(1, weight=1)
+
+        self.filter_text.trace_add("write", self._schedule_filter)
+        self.listbox.bind("<Button-1>", self._on_click)
+        self.listbox.bind("<MouseWheel>", lambda e: self._scroll(-1 if e.delta > 0 else 1))
+        self.listbox.bind("<Button-4>", lambda e: self._scroll(-1))
+        self.listbox.bind("<Button-5>", lambda e: self._scroll(1))
+        for key, step in (("<Up>", -1), ("<Down>", 1), ("<Prior>", -height), ("<Next>", height)):
+            self.listbox.bind(key, lambda e, step=step: self._scroll(step))
+        self._render()
+
+    def set_names(self, names: Iterable):
+        """Replace the names; selections not among them are dropped."""
+        self.index = NameIndex(names)
+        self.selected &= set(self.index.names)
+        self._apply_filter()
+
+    def selection(self) -> List:
+        """Selected names in sorted order."""
+        return [name for name in self.index.names if name in self.selected]
+
+    def clear_selection(self):
+        self.selected.clear()
+        self._render()
+        self._selection_changed()
+
+    def _selection_changed(self):
+        if self.command is not None:
+            self.command()
+
+    def _schedule_filter(self, *args):
+        # Wait for a pause in typing before searching
+        if self._pending is not None:
+            self.after_cancel(self._pending)
+        self._pending = self.after(self.filter_delay, self._apply_filter)
+
+    def _apply_filter(self):
+        self._pending = None
+        self._matches = self.index.search(self.filter_text.get())
+        self._top = 0
+        self._render()
+
+    def _scroll(self, rows: int):
+        self._top = max(0, min(self._top + rows, len(self._matches) - self.height))
+        self._render()
+        return "break"
+
+    def _on_scrollbar(self, action, amount, unit=None):
+        if action == "moveto":
+            self._top = int(float(amount) * len(self._matches))
+            self._scroll(0)
+        elif action == "scroll":
+            self._scroll(int(amount) * (self.height if unit == "pages" else 1))
+
+    def _on_click(self, event):
+        row = self.listbox.nearest(event.y)
+        position = self._top + row
+        if 0 <= row < self.height and position < len(self._matches):
+            name = self.index.names[self._matches[position]]
+            self.selected.symmetric_difference_update({name})
+            self._render()
+            self._selection_changed()
+        self.listbox.focus_set()
+        return "break"
+
+    def _render(self):
+        visible = self._matches[self._top:self._top + self.height]
+        names = self.index.names
+        self.listbox.delete(0, tk.END)
+        self.listbox.insert(tk.END, *(str(names[i]) for i in visible))
+        for row, i in enumerate(visible):
+            if names[i] in self.selected:
+                self.listbox.selection_set(row)
+
+        total = len(self._matches)
+        if total:
+            self.scrollbar.set(self._top / total, min(1.0, (self._top + self.height) / total))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+        self.status.set(f"{total} of {len(names)} shown, {len(self.selected)} selected")
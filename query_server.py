@@ -0,0 +1,240 @@
+"""
+Local MALDI query server
+
+Loads a database (CSV or snapshot) once and keeps it hot, serving searches to
+any number of scripts and notebooks over a small HTTP/JSON API on localhost.
+Single m/z searches arriving close together are batched into one
+match_peaks() call. MALDIClient mirrors the MALDIDatabase search methods.
+
+    python query_server.py maldi_database.csv --port 8765
+
+Endpoints (POST, JSON object of keyword arguments):
+    /search_by_mz  /match_peaks  /search_by_metabolite  /search_by_literature
+    /get_statistics  /batch  (body: {"calls": [{"method": ..., "params": {...}}]})
+
+Dependencies: standard library (server side needs the database's own dependencies)
+"""
+
+import asyncio
+import http.client
+import json
+from typing import Dict, List, Optional, Tuple
+
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+METHODS = ("search_by_mz", "match_peaks", "search_by_metabolite",
+           "search_by_literature", "get_statistics")
+
+
+def open_database(path: str):
+    """Open a snapshot if path is one, otherwise the CSV database."""
+    from snapshot import MALDISnapshot, is_snapshot
+
+    if is_snapshot(path):
+        return MALDISnapshot(path)
+    from database_builder import MALDIDatabase
+    return MALDIDatabase(path, read_only=True)
+
+
+def _encode_frame(df) -> Dict:
+    df = df.astype(object).where(df.notna(), None)
+    return {"columns": list(df.columns), "index": df.index.tolist(),
+            "data": df.values.tolist()}
+
+
+def _decode_frame(payload: Dict):
+    import pandas as pd
+    return pd.DataFrame(payload["data"], index=payload["index"], columns=payload["columns"])
+
+
+class MALDIQueryServer:
+    """
+    asyncio HTTP/JSON server around one open database.
+
+    Args:
+        db: MALDIDatabase or snapshot.MALDISnapshot
+        batch_window: Seconds to collect concurrent search_by_mz requests into one batch
+    """
+
+    def __init__(self, db, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT,
+                 batch_window: float = 0.002):
+        self.db = db
+        self.host = host
+        self.port = port
+        self.batch_window = batch_window
+        self._pending: Dict[Tuple, List] = {}
+
+    def call(self, method: str, params: Dict):
+        """Run one database method and return a JSON-serialisable result."""
+        if method not in METHODS:
+            raise ValueError(f"Unknown method: {method}")
+        result = getattr(self.db, method)(**params)
+        return result if isinstance(result, dict) else _encode_frame(result)
+
+    async def _search_by_mz(self, params: Dict):
+        """Queue a numeric m/z search to be answered by a shared match_peaks call."""
+        try:
+            mz = float(params["mz_value"])
+        except ValueError:
+            return self.call("search_by_mz", params)
+        columns = params.get("columns")
+        key = (float(params.get("tolerance", 0.5)), tuple(columns) if columns else None)
+
+        future = asyncio.get_running_loop().create_future()
+        batch = self._pending.setdefault(key, [])
+        batch.append((mz, future))
+        if len(batch) == 1:
+            asyncio.get_running_loop().call_later(self.batch_window, self._flush, key)
+        return await future
+
+    def _flush(self, key: Tuple):
+        batch = self._pending.pop(key, [])
+        tolerance, columns = key
+        try:
+            queries = sorted({mz for mz, _ in batch})
+            matches = self.db.match_peaks(queries, tolerance=tolerance,
+                                          columns=list(columns) if columns else None)
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        groups = dict(tuple(matches.groupby('query_mz', sort=False)))
+        empty = matches.iloc[0:0]
+        for mz, future in batch:
+            # Database row order, as search_by_mz() returns it
+            rows = groups.get(mz, empty).sort_index()
+            future.set_result(_encode_frame(rows.drop(columns='query_mz')))
+
+    async def dispatch(self, method: str, params: Dict):
+        if method == "batch":
+            # Run concurrently so the batch's m/z searches share one match_peaks call
+            return list(await asyncio.gather(*(
+                self.dispatch(call["method"], call.get("params", {})) for call in params["calls"]
+            )))
+        if method == "search_by_mz":
+            return await self._search_by_mz(params)
+        return self.call(method, params)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    key, _, value = line.decode("latin-1").partition(":")
+                    headers[key.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+                method = request_line.decode("latin-1").split()[1].strip("/")
+                try:
+                    result = await self.dispatch(method, json.loads(body or b"{}"))
+                    status, payload = "200 OK", {"result": result}
+                except Exception as e:
+                    status, payload = "400 Bad Request", {"error": f"{type(e).__name__}: {e}"}
+
+                data = json.dumps(payload).encode("utf-8")
+                writer.write(f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\n"
+                             f"Content-Length: {len(data)}\r\n\r\n".encode("latin-1") + data)
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self):
+        server = await asyncio.start_server(self._handle, self.host, self.port)
+        print(f"Serving MALDI database on http://{self.host}:{self.port}")
+        async with server:
+            await server.serve_forever()
+
+    def run(self):
+        """Serve until interrupted."""
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            print("Server stopped")
+
+
+class MALDIClient:
+    """Thin client for MALDIQueryServer with the MALDIDatabase search signatures."""
+
+    def __init__(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, timeout: float = 60.0):
+        self._connection = http.client.HTTPConnection(host, port, timeout=timeout)
+
+    def _post(self, method: str, params: Optional[Dict] = None):
+        body = json.dumps(params or {})
+        try:
+            self._connection.request("POST", f"/{method}", body,
+                                     {"Content-Type": "application/json"})
+            response = self._connection.getresponse()
+        except (ConnectionError, http.client.HTTPException):
+            # Reconnect once if the keep-alive connection went away
+            self._connection.close()
+            self._connection.request("POST", f"/{method}", body,
+                                     {"Content-Type": "application/json"})
+            response = self._connection.getresponse()
+        payload = json.loads(response.read())
+        if "error" in payload:
+            raise RuntimeError(payload["error"])
+        return payload["result"]
+
+    def close(self):
+        self._connection.close()
+
+    def search_by_mz(self, mz_value: str, tolerance: float = 0.5,
+                     columns: Optional[List[str]] = None):
+        """Search by m/z value with tolerance (default ±0.5 Da)."""
+        return _decode_frame(self._post("search_by_mz", {"mz_value": str(mz_value),
+                                                         "tolerance": tolerance,
+                                                         "columns": columns}))
+
+    def match_peaks(self, mz_values: List[float], tolerance: float = 0.5,
+                    columns: Optional[List[str]] = None):
+        """Match many observed peaks in one request."""
+        return _decode_frame(self._post("match_peaks", {"mz_values": [float(v) for v in mz_values],
+                                                        "tolerance": tolerance,
+                                                        "columns": columns}))
+
+    def search_by_metabolite(self, metabolite_name: str, columns: Optional[List[str]] = None):
+        """Search by metabolite name (case-insensitive substring match)."""
+        return _decode_frame(self._post("search_by_metabolite",
+                                        {"metabolite_name": metabolite_name,
+                                         "columns": columns}))
+
+    def search_by_literature(self, source: str, columns: Optional[List[str]] = None):
+        """Search by literature source."""
+        return _decode_frame(self._post("search_by_literature",
+                                        {"source": source, "columns": columns}))
+
+    def get_statistics(self) -> Dict:
+        """Get database summary statistics."""
+        return self._post("get_statistics")
+
+    def batch(self, calls: List[Dict]) -> List:
+        """
+        Run several calls in one request: [{"method": ..., "params": {...}}, ...].
+        DataFrame results are returned as DataFrames.
+        """
+        results = self._post("batch", {"calls": calls})
+        return [r if "data" not in r else _decode_frame(r) for r in results]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Serve a MALDI database on localhost")
+    parser.add_argument("database", help="Database CSV or snapshot file")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    args = parser.parse_args()
+
+    MALDIQueryServer(open_database(args.database), args.host, args.port).run()
@@ -37,6 +37,11 @@ db.batch_process(
 )
 db.save()
 
+# Search-only scripts can open a memory-mapped snapshot instead of the CSV
+# db.export_snapshot("metabolite_database.snap")
+# from snapshot import MALDISnapshot
+# db = MALDISnapshot("metabolite_database.snap")
+
 # Step 3: Search and analyze
 print("\n" + "=" * 60)
 print("STEP 3: Searching database")
@@ -0,0 +1,192 @@
+"""
+Sharded MALDI database build
+
+Each batch_process worker writes its own shard with MALDIDatabase.save_shards()
+(one CSV per worker or per literature source, rows sorted by m/z). This module
+streams a k-way merge of the shards into one consolidated database CSV plus a
+sparse m/z index, deduplicating on the way. Memory is bounded by the number of
+shards and the rows inside one dedup window, not by database size.
+
+Dependencies: none (standard library only; mz_sort_order takes a pandas Series)
+"""
+
+import bisect
+import csv
+import heapq
+import io
+import re
+from collections import deque
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from dedup import DedupIndex, canonical_mz, parse_mz
+
+
+INDEX_SUFFIX = ".mzidx.csv"
+
+
+def mz_sort_key(mz_value) -> Tuple:
+    """Sort key for shard rows: numeric m/z ascending, non-numeric values last."""
+    mz = parse_mz(mz_value)
+    if mz is None:
+        return (1, 0.0, canonical_mz(mz_value))
+    return (0, mz, "")
+
+
+def mz_sort_order(mz_values):
+    """
+    Row order that sorts a pandas Series of m/z values by mz_sort_key(),
+    computed vectorised (stable, so equal values keep their order).
+    """
+    import pandas as pd
+
+    # str() per value, as parse_mz() does (astype(str) keeps missing values as NaN)
+    text = mz_values.map(str).str.strip()
+    mz = pd.to_numeric(text, errors="coerce")
+    non_numeric = mz.isna()
+    keys = pd.DataFrame({
+        "non_numeric": non_numeric.to_numpy(),
+        "mz": mz.fillna(0.0).to_numpy(),
+        "text": text.str.lower().where(non_numeric, "").to_numpy(),
+    })
+    return keys.sort_values(["non_numeric", "mz", "text"], kind="stable").index.to_numpy()
+
+
+def shard_name(literature_source) -> str:
+    """File-name-safe shard name for a literature source."""
+    slug = re.sub(r"[^0-9a-z]+", "-", str(literature_source or "").lower()).strip("-")
+    return slug or "unknown-source"
+
+
+def index_path(csv_path: str) -> str:
+    """Path of the sparse m/z index written next to a merged database."""
+    return str(csv_path) + INDEX_SUFFIX
+
+
+def _read_shard(path: str) -> Iterator[Tuple[Tuple, Dict]]:
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            yield mz_sort_key(row.get("mz_value", "")), row
+
+
+class _WindowDedup:
+    """DedupIndex over a sliding m/z window of the sorted merge stream."""
+
+    def __init__(self, mz_tolerance: Optional[float]):
+        self.window = mz_tolerance or 0.0
+        self.index = DedupIndex(mz_tolerance=mz_tolerance)
+        self._recent = deque()
+
+    def add(self, key: Tuple, record: Dict) -> bool:
+        # Rows arrive sorted, so anything further than the tolerance below
+        # the current m/z can never match again
+        while self._recent:
+            old_key, old_record = self._recent[0]
+            if old_key[0] == key[0] and (
+                old_key[1] >= key[1] - self.window if key[0] == 0 else old_key[2] == key[2]
+            ):
+                break
+            self.index.discard(old_record)
+            self._recent.popleft()
+
+        if not self.index.add(record):
+            return False
+        self._recent.append((key, record))
+        return True
+
+
+def merge_shards(shard_paths: List[str], output_csv: str,
+                 dedup_tolerance: Optional[float] = None, index_every: int = 1024) -> int:
+    """
+    Merge m/z-sorted shards into one database CSV and its sparse m/z index.
+
+    Args:
+        shard_paths: Shard CSVs written by MALDIDatabase.save_shards()
+        output_csv: Consolidated database path (readable by MALDIDatabase)
+        dedup_tolerance: Near-duplicate m/z tolerance, as in MALDIDatabase
+        index_every: Rows per block of the sparse m/z index
+
+    Returns:
+        Number of rows written
+    """
+    fieldnames = []
+    for path in shard_paths:
+        with open(path, newline="", encoding="utf-8") as f:
+            for column in next(csv.reader(f), []):
+                if column not in fieldnames:
+                    fieldnames.append(column)
+
+    # heapq.merge is stable, so the first shard wins ties (keep='first')
+    merged = heapq.merge(*(_read_shard(p) for p in shard_paths), key=lambda item: item[0])
+    dedup = _WindowDedup(dedup_tolerance)
+
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fieldnames, restval="")
+    written = duplicates = 0
+
+    with open(output_csv, "wb") as out, \
+         open(index_path(output_csv), "w", newline="", encoding="utf-8") as idx:
+        index_writer = csv.writer(idx)
+        index_writer.writerow(["mz_value", "offset", "row"])
+
+        writer.writeheader()
+        for key, record in merged:
+            if not dedup.add(key, record):
+                duplicates += 1
+                continue
+            if written % index_every == 0:
+                out.write(buffer.getvalue().encode("utf-8"))
+                buffer.seek(0)
+                buffer.truncate()
+                index_writer.writerow([record.get("mz_value", ""), out.tell(), written])
+            writer.writerow(record)
+            written += 1
+            if buffer.tell() > 1 << 16:
+                out.write(buffer.getvalue().encode("utf-8"))
+                buffer.seek(0)
+                buffer.truncate()
+        out.write(buffer.getvalue().encode("utf-8"))
+
+    print(f"Merged {len(shard_paths)} shards into {output_csv} "
+          f"({written} entries, {duplicates} duplicates removed)")
+    return written
+
+
+def iter_mz_range(csv_path: str, mz_min: float, mz_max: float) -> Iterator[Dict]:
+    """
+    Stream rows of a merged database with mz_min <= m/z <= mz_max.
+    Uses the sparse index to seek, so only the matching blocks are read.
+    """
+    with open(index_path(csv_path), newline="", encoding="utf-8") as f:
+        blocks = [(float(mz), int(offset)) for mz, offset, _ in list(csv.reader(f))[1:]
+                  if parse_mz(mz) is not None]
+    if not blocks:
+        return
+
+    block_mz = [mz for mz, _ in blocks]
+    start = max(bisect.bisect_left(block_mz, mz_min) - 1, 0)
+
+    with open(csv_path, "rb") as raw:
+        header = next(csv.reader([raw.readline().decode("utf-8")]))
+        raw.seek(blocks[start][1])
+        for row in csv.DictReader(io.TextIOWrapper(raw, encoding="utf-8", newline=""),
+                                  fieldnames=header):
+            mz = parse_mz(row.get("mz_value"))
+            if mz is None or mz > mz_max:
+                return
+            if mz >= mz_min:
+                yield row
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Merge MALDI database shards")
+    parser.add_argument("output", help="Consolidated database CSV")
+    parser.add_argument("shards", nargs="+", help="Shard CSVs (sorted by m/z)")
+    parser.add_argument("--tolerance", type=float, default=None,
+                        help="Near-duplicate m/z tolerance in Da")
+    parser.add_argument("--index-every", type=int, default=1024,
+                        help="Rows per sparse index block")
+    args = parser.parse_args()
+
+    merge_shards(args.shards, args.output, args.tolerance, args.index_every)
@@ -0,0 +1,240 @@
+"""
+Read-only MALDI database snapshots
+
+Immutable binary columnar copy of a MALDIDatabase for search-only use.
+Opening maps the file with mmap and parses a small JSON header - no CSV
+parsing, no API client - so start-up cost does not grow with database size,
+and processes opening the same snapshot share pages through the OS cache.
+
+Layout (little-endian, every buffer 8-byte aligned):
+    b"MALDISN1" | uint64 header length | JSON header | buffers
+    mz                 float64[rows]   rows sorted by m/z, non-numeric (NaN) last
+    <column>.offsets   int64[rows + 1] string column as offset + UTF-8 data buffers
+    <column>.data      uint8[...]
+    <column>.valid     uint8[rows]     0 where the value was missing
+Buffer positions in the header are relative to the first aligned byte after it.
+
+Dependencies: numpy (pandas only when results are returned as DataFrames)
+"""
+
+import json
+import mmap
+import struct
+from typing import Dict, List
+
+import numpy as np
+
+from db_stats import DatabaseStats
+from shard_merge import mz_sort_order
+
+
+MAGIC = b"MALDISN1"
+VERSION = 1
+_PREFIX = len(MAGIC) + 8
+
+
+def _aligned(n: int) -> int:
+    return -(-n // 8) * 8
+
+
+def _json_safe(stats: Dict) -> Dict:
+    return {k: {str(name): int(n) for name, n in v.items()} if isinstance(v, dict) else int(v)
+            for k, v in stats.items()}
+
+
+def is_snapshot(path: str) -> bool:
+    """True if path is a snapshot file (checks the magic bytes only)."""
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def write_snapshot(df, path: str) -> int:
+    """
+    Write DataFrame (MALDIDatabase.df) as a snapshot file.
+    Returns number of rows written.
+    """
+    import pandas as pd
+
+    columns = [str(column) for column in df.columns]
+    order = mz_sort_order(df['mz_value'].reset_index(drop=True))
+
+    mz = pd.to_numeric(df['mz_value'].map(str).str.strip(), errors="coerce")
+    mz = mz.to_numpy(dtype=np.float64)[order]
+    buffers = [("mz", mz.tobytes())]
+
+    for column in columns:
+        values = df[column].iloc[order]
+        valid = (~values.isna()).to_numpy(dtype=np.uint8)
+        encoded = values.astype(str).where(valid.astype(bool), "").str.encode("utf-8")
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum(encoded.str.len().to_numpy(dtype=np.int64), out=offsets[1:])
+        buffers += [
+            (f"{column}.offsets", offsets.tobytes()),
+            (f"{column}.data", b"".join(encoded)),
+            (f"{column}.valid", valid.tobytes()),
+        ]
+
+    layout, position = {}, 0
+    for name, data in buffers:
+        layout[name] = [position, len(data)]
+        position += _aligned(len(data))
+
+    header = {
+        "version": VERSION,
+        "rows": len(df),
+        "numeric_rows": int(np.count_nonzero(~np.isnan(mz))),
+        "columns": columns,
+        "buffers": layout,
+        "statistics": _json_safe(DatabaseStats.from_frame(df).summary()),
+    }
+    header_bytes = json.dumps(header).encode("utf-8")
+
+    with open(path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<Q", len(header_bytes)))
+        f.write(header_bytes)
+        f.write(b"\0" * (_aligned(f.tell()) - f.tell()))
+        for _, data in buffers:
+            f.write(data)
+            f.write(b"\0" * (_aligned(len(data)) - len(data)))
+
+    print(f"Snapshot saved to {path} ({len(df)} entries)")
+    return len(df)
+
+
+class MALDISnapshot:
+    """
+    Memory-mapped, read-only view of a snapshot written by write_snapshot().
+    Search methods mirror MALDIDatabase and return DataFrames.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self._mm[:len(MAGIC)] != MAGIC:
+            self._mm.close()
+            raise ValueError(f"{path} is not a MALDI snapshot")
+        (header_length,) = struct.unpack("<Q", self._mm[len(MAGIC):_PREFIX])
+        self.header = json.loads(self._mm[_PREFIX:_PREFIX + header_length])
+        if self.header["version"] != VERSION:
+            self._mm.close()
+            raise ValueError(f"Unsupported snapshot version {self.header['version']}")
+
+        self._data_start = _aligned(_PREFIX + header_length)
+        self.columns: List[str] = self.header["columns"]
+        self.mz = self._buffer("mz", np.float64)
+        # Sorted numeric prefix of the m/z array, searched with searchsorted
+        self._sorted_mz = self.mz[:self.header["numeric_rows"]]
+
+    def _buffer(self, name: str, dtype) -> np.ndarray:
+        offset, nbytes = self.header["buffers"][name]
+        return np.frombuffer(self._mm, dtype=dtype, count=nbytes // np.dtype(dtype).itemsize,
+                             offset=self._data_start + offset)
+
+    def __len__(self) -> int:
+        return self.header["rows"]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """Release the memory map. Arrays taken from the snapshot become invalid."""
+        self.mz = self._sorted_mz = None
+        self._mm.close()
+
+    def column_values(self, column: str, rows) -> List:
+        """Decode values of one column for the given row numbers (None if missing)."""
+        offsets = self._buffer(f"{column}.offsets", np.int64)
+        valid = self._buffer(f"{column}.valid", np.uint8)
+        start = self._data_start + self.header["buffers"][f"{column}.data"][0]
+        mm = self._mm
+        return [
+            mm[start + offsets[i]:start + offsets[i + 1]].decode("utf-8") if valid[i] else None
+            for i in rows
+        ]
+
+    def rows(self, rows, columns: List[str] = None):
+        """Materialise rows (snapshot row numbers) as a DataFrame."""
+        import pandas as pd
+
+        rows = np.asarray(rows, dtype=np.int64)
+        columns = columns or self.columns
+        return pd.DataFrame({c: self.column_values(c, rows) for c in columns},
+                            index=rows, columns=columns)
+
+    def _contains(self, column: str, text: str) -> np.ndarray:
+        """Row numbers whose value contains text (ASCII case-insensitive)."""
+        offsets = self._buffer(f"{column}.offsets", np.int64)
+        valid = self._buffer(f"{column}.valid", np.uint8)
+        needle = text.lower().encode("utf-8")
+        if not needle:
+            return np.flatnonzero(valid)
+
+        data = self._buffer(f"{column}.data", np.uint8).tobytes().lower()
+        hits = []
+        position = data.find(needle)
+        while position != -1:
+            hits.append(position)
+            position = data.find(needle, position + 1)
+
+        hits = np.array(hits, dtype=np.int64)
+        rows = np.searchsorted(offsets, hits, side="right") - 1
+        # A match must lie entirely inside one value
+        rows = np.unique(rows[hits + len(needle) <= offsets[rows + 1]])
+        return rows[valid[rows] == 1]
+
+    def find_mz(self, mz_value: str, tolerance: float = 0.5) -> np.ndarray:
+        """Row numbers for search_by_mz() (no pandas needed)."""
+        try:
+            mz_float = float(mz_value)
+        except ValueError:
+            return self._contains('mz_value', mz_value)
+        if not np.isfinite(mz_float):
+            return np.arange(0)
+        lo = np.searchsorted(self._sorted_mz, mz_float - tolerance, side="left")
+        hi = np.searchsorted(self._sorted_mz, mz_float + tolerance, side="right")
+        return np.arange(lo, hi)
+
+    def find_metabolite(self, metabolite_name: str) -> np.ndarray:
+        """Row numbers for search_by_metabolite()."""
+        return self._contains('metabolite_name', metabolite_name)
+
+    def find_literature(self, source: str) -> np.ndarray:
+        """Row numbers for search_by_literature()."""
+        return self._contains('literature_source', source)
+
+    def search_by_mz(self, mz_value: str, tolerance: float = 0.5, columns: List[str] = None):
+        """Search by m/z value with tolerance (default ±0.5 Da)."""
+        return self.rows(self.find_mz(mz_value, tolerance), columns)
+
+    def match_peaks(self, mz_values: List[float], tolerance: float = 0.5,
+                    columns: List[str] = None):
+        """
+        Match many observed peaks in one pass (binary search per peak).
+        Returns matching rows with the peak they matched in a 'query_mz' column.
+        """
+        queries = np.asarray(mz_values, dtype=np.float64)
+        lo = np.searchsorted(self._sorted_mz, queries - tolerance, side="left")
+        hi = np.searchsorted(self._sorted_mz, queries + tolerance, side="right")
+        hi[~np.isfinite(queries)] = lo[~np.isfinite(queries)]  # NaN/inf peaks match nothing
+        rows = np.concatenate([np.arange(a, b) for a, b in zip(lo, hi)] or [np.array([], dtype=np.int64)])
+        results = self.rows(rows, columns)
+        results.insert(0, 'query_mz', np.repeat(queries, hi - lo))
+        return results
+
+    def search_by_metabolite(self, metabolite_name: str, columns: List[str] = None):
+        """Search by metabolite name (case-insensitive substring match)."""
+        return self.rows(self.find_metabolite(metabolite_name), columns)
+
+    def search_by_literature(self, source: str, columns: List[str] = None):
+        """Search by literature source."""
+        return self.rows(self.find_literature(source), columns)
+
+    def get_statistics(self) -> Dict:
+        """Database summary statistics, computed when the snapshot was written."""
+        return dict(self.header["statistics"])
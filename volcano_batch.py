@@ -0,0 +1,193 @@
+"""
+Headless batch volcano plots
+
+Renders many comparison tables (CSV like test.csv) without the Tk dialog,
+using the Agg backend in parallel worker processes. Each worker keeps one
+Figure and clears it between plots instead of creating a new one per table.
+
+    python volcano_batch.py results/*.csv --config study.json --out-dir plots --formats png pdf
+    python volcano_batch.py KO_vs_WT.csv:KO_vs_WT.json
+
+A job is CSV or CSV:CONFIG. Config files are JSON objects of render_volcano()
+options (x, y, name, thresholds, colors, pofi, title, density, ...); per-job
+configs override --config, which overrides the defaults. The title defaults
+to the CSV name.
+
+Tables of raw replicate intensities can be plotted directly: give the
+replicate columns as "group_a" and "group_b" (names or glob patterns, e.g.
+["WT_*"]) and optionally "equal_var": false for Welch's t-test. FC, Log2FC
+and p-values are then computed by diffstats.py before plotting.
+
+Dependencies: numpy, pandas, matplotlib
+"""
+
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from volcano_render import DEFAULT_OPTIONS, VolcanoDataset, render_volcano
+
+
+FORMATS = ("png", "svg", "pdf")
+
+# One figure per worker process, reused between plots
+_FIGURE = None
+
+
+def _figure(width: float, height: float) -> Figure:
+    global _FIGURE
+    if _FIGURE is None:
+        _FIGURE = Figure()
+        FigureCanvasAgg(_FIGURE)
+    _FIGURE.set_size_inches(width, height)
+    return _FIGURE
+
+
+def load_config(path: Optional[str]) -> Dict:
+    if not path:
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def parse_job(spec: str) -> Tuple[str, Optional[str]]:
+    """Split CSV[:CONFIG] (a drive letter colon is not a separator)."""
+    head, sep, tail = spec.rpartition(":")
+    if sep and head and tail.lower().endswith(".json"):
+        return head, tail
+    return spec, None
+
+
+def build_jobs(specs: List[str], config_path: Optional[str] = None) -> List[Tuple[str, Dict]]:
+    """(csv_path, options) jobs from CSV[:CONFIG] specs and a shared config file."""
+    shared = load_config(config_path)
+    jobs = []
+    for spec in specs:
+        csv_path, job_config = parse_job(spec)
+        jobs.append((csv_path, {**shared, **load_config(job_config)}))
+    return jobs
+
+
+def output_stems(csv_paths: List[str]) -> List[str]:
+    """
+    Output file stem per job: the CSV name, with _2, _3... added when several
+    jobs share it (same table with different configs, or same name in two folders).
+    """
+    used, stems = set(), []
+    for csv_path in csv_paths:
+        base = stem = os.path.splitext(os.path.basename(csv_path))[0]
+        n = 1
+        while stem in used:
+            n += 1
+            stem = f"{base}_{n}"
+        used.add(stem)
+        stems.append(stem)
+    return stems
+
+
+def render_job(csv_path: str, options: Dict, out_dir: str, formats: List[str],
+               dpi: int = 150, size: Tuple[float, float] = (6.4, 4.8),
+               output_stem: Optional[str] = None) -> Dict:
+    """
+    Render one CSV to out_dir/<output_stem>.<format> for each format
+    (output_stem defaults to the CSV name).
+    Returns a report dict (csv, outputs, rows, seconds, error).
+    """
+    start = time.perf_counter()
+    options = {**DEFAULT_OPTIONS, **options}
+    # Raw replicate tables: statistics are computed first (see diffstats.py)
+    groups = {k: options.pop(k) for k in ("group_a", "group_b", "equal_var") if k in options}
+    if not options["title"]:
+        options["title"] = os.path.splitext(os.path.basename(csv_path))[0]
+    report = {"csv": csv_path, "outputs": [], "rows": 0, "seconds": 0.0, "error": None}
+
+    try:
+        if groups:
+            from diffstats import differential_table, select_columns
+
+            dataset = VolcanoDataset(csv_path)
+            columns = dataset.columns
+            # Match group columns on the header so only the replicates are read
+            replicates = (select_columns(columns, groups["group_a"])
+                          + select_columns(columns, groups["group_b"]))
+            data = differential_table(dataset.frame([options["name"]] + replicates),
+                                      groups["group_a"], groups["group_b"],
+                                      equal_var=groups.get("equal_var", True))
+        else:
+            data = VolcanoDataset(csv_path).frame([options["x"], options["y"], options["name"]])
+        report["rows"] = len(data)
+
+        fig = _figure(*size)
+        render_volcano(fig, data, **options)
+        stem = os.path.join(out_dir, output_stem or os.path.splitext(os.path.basename(csv_path))[0])
+        for fmt in formats:
+            output = f"{stem}.{fmt}"
+            fig.savefig(output, format=fmt, dpi=dpi)
+            report["outputs"].append(output)
+        fig.clf()
+    except Exception as e:
+        report["error"] = f"{type(e).__name__}: {e}"
+
+    report["seconds"] = time.perf_counter() - start
+    return report
+
+
+def _render_job(args):
+    return render_job(*args)
+
+
+def batch_render(jobs: List[Tuple[str, Dict]], out_dir: str, formats: List[str] = ("png",),
+                 workers: Optional[int] = None, dpi: int = 150,
+                 size: Tuple[float, float] = (6.4, 4.8)) -> List[Dict]:
+    """
+    Render (csv_path, options) jobs in worker processes.
+    workers=1 renders in this process. Returns one report per job, in order.
+    Jobs whose CSVs share a name get distinct outputs (see output_stems).
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    stems = output_stems([csv_path for csv_path, _ in jobs])
+    tasks = [(csv_path, options, out_dir, list(formats), dpi, size, stem)
+             for (csv_path, options), stem in zip(jobs, stems)]
+    workers = workers or os.cpu_count() or 1
+
+    if workers == 1 or len(tasks) <= 1:
+        reports = [_render_job(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+            reports = list(pool.map(_render_job, tasks, chunksize=max(1, len(tasks) // (4 * workers))))
+
+    for report in reports:
+        if report["error"]:
+            print(f"✗ {report['csv']}: {report['error']}")
+        else:
+            print(f"✓ {report['csv']} ({report['rows']} rows, {report['seconds']:.2f}s)")
+    return reports
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Render volcano plots without the GUI")
+    parser.add_argument("jobs", nargs="+", metavar="CSV[:CONFIG]",
+                        help="Comparison table, optionally with its own JSON config")
+    parser.add_argument("--config", help="JSON config applied to every job")
+    parser.add_argument("--out-dir", default="volcano_plots")
+    parser.add_argument("--formats", nargs="+", default=["png"], choices=FORMATS)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--dpi", type=int, default=150)
+    parser.add_argument("--size", type=float, nargs=2, default=[6.4, 4.8], metavar=("W", "H"),
+                        help="Figure size in inches")
+    args = parser.parse_args()
+
+    jobs = build_jobs(args.jobs, args.config)
+
+    start = time.perf_counter()
+    reports = batch_render(jobs, args.out_dir, args.formats, args.workers, args.dpi, tuple(args.size))
+    failed = sum(1 for r in reports if r["error"])
+    print(f"\nRendered {len(reports) - failed}/{len(reports)} plots to {args.out_dir} "
+          f"in {time.perf_counter() - start:.1f}s")
@@ -1,13 +1,17 @@
 import tkinter as tk
 from tkinter import filedialog, colorchooser, ttk, messagebox
-import pandas as pd
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-from adjustText import adjust_text
+from volcano_render import VolcanoDataset, VolcanoView
+from poi_picker import PointsOfInterestPicker
 
 user_inputs = {}
+view = None
 
 def get_user_input():
+    # Loaded once per file; columns are read on demand and reloaded when the file changes
+    dataset = VolcanoDataset()
+
     def browse_file():
         filename = filedialog.askopenfilename(filetypes=[("CSV files", "*.csv")])
         if filename:
@@ -16,13 +20,12 @@ def get_user_input():
 
     def load_columns():
         try:
-            df = pd.read_csv(data.get())
-            columns = list(df.columns)
+            dataset.path = data.get()
+            columns = dataset.columns
+            update_menu_options(columns)
             x.set(columns[0])
             y.set(columns[1])
-            name.set(columns[2])
-            update_menu_options(columns)
-            name_updated()
+            name.set(columns[2])  # name trace refreshes the points of interest
         except Exception as e:
             messagebox.showerror("Error", f"Failed to load columns: {e}")
 
@@ -31,50 +34,77 @@ def get_user_input():
             menu['menu'].delete(0, 'end')
             for col in columns:
                 menu['menu'].add_command(label=col, command=tk._setit(var, col))
-        name.trace_add("write", name_updated)  # Update trace to handle changes
 
     def name_updated(*args):
         try:
-            df = pd.read_csv(data.get())
             selected_name_col = name.get()
-            update_points_of_interest_list(df[selected_name_col].values)
+            if not selected_name_col:
+                return
+            dataset.path = data.get()
+            update_points_of_interest_list(dataset.column(selected_name_col).values)
         except Exception as e:
             messagebox.showerror("Error", f"Failed to update points of interest: {e}")
 
     def update_points_of_interest_list(items):
-        pofi_listbox.delete(0, tk.END)
-        for item in items:
-            pofi_listbox.insert(tk.END, item)
+        pofi_picker.set_names(items)
 
     def choose_color(var):
         color_code = colorchooser.askcolor(title="Choose a color")[1]
         if color_code:
             var.set(color_code)
 
+    def collect_inputs():
+        dataset.path = data.get()
+        return {
+            'title': title.get(),
+            'data': dataset.frame([x.get(), y.get(), name.get()]),
+            'x': x.get(),
+            'y': y.get(),
+            'name': name.get(),
+            'fc_threshold_lower': float(fc_threshold_lower.get()),
+            'fc_threshold_upper': float(fc_threshold_upper.get()),
+            'sig_threshold': float(sig_threshold.get()),
+            'show_labels': show_labels.get(),
+            'ns_color': ns_color.get(),
+            'ur_color': ur_color.get(),
+            'dr_color': dr_color.get(),
+            'poi_color': poi_color.get(),
+            'pofi': pofi_picker.selection(),
+            'density': density.get()
+        }
+
     def submit():
         try:
-            selected_pofi = [pofi_listbox.get(i) for i in pofi_listbox.curselection()]
             global user_inputs
-            user_inputs = {
-                'title': title.get(),
-                'data': pd.read_csv(data.get()),
-                'x': x.get(),
-                'y': y.get(),
-                'name': name.get(),
-                'fc_threshold_lower': float(fc_threshold_lower.get()),
-                'fc_threshold_upper': float(fc_threshold_upper.get()),
-                'sig_threshold': float(sig_threshold.get()),
-                'show_labels': show_labels.get(),
-                'ns_color': ns_color.get(),
-                'ur_color': ur_color.get(),
-                'dr_color': dr_color.get(),
-                'poi_color': poi_color.get(),
-                'pofi': selected_pofi
-            }
+            user_inputs = collect_inputs()
             plot_volcano()
         except Exception as e:
             messagebox.showerror("Error", f"Failed to submit inputs: {e}")
 
+    pending_refresh = None
+
+    def schedule_refresh(*args):
+        # Once a plot is shown, option changes update it live (after a pause in typing)
+        nonlocal pending_refresh
+        if view is None:
+            return
+        if pending_refresh is not None:
+            root.after_cancel(pending_refresh)
+        pending_refresh = root.after(100, refresh)
+
+    def refresh():
+        nonlocal pending_refresh
+        pending_refresh = None
+        try:
+            global user_inputs
+            user_inputs = collect_inputs()
+            plot_volcano()
+        except ValueError:
+            # Half-typed numbers or colours; the next valid edit updates the plot
+            pass
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to update plot: {e}")
+
     root = tk.Tk()
     root.title("User Input")
 
@@ -99,7 +129,7 @@ def get_user_input():
     dr_color = tk.StringVar()
     poi_color = tk.StringVar()
     show_labels = tk.BooleanVar()
-    points_of_interest = tk.StringVar()
+    density = tk.BooleanVar()
 
     input_frame = ttk.Frame(root)
     input_frame.grid(row=0, column=0, sticky="nsew")
@@ -131,6 +161,8 @@ def get_user_input():
     name_menu = ttk.OptionMenu(input_frame, name, "")
     name_menu.grid(row=4, column=1, sticky="ew")
 
+    name.trace_add("write", name_updated)
+
     ttk.Label(input_frame, text="FC Threshold Lower").grid(row=5, column=0, sticky="w")
     ttk.Entry(input_frame, textvariable=fc_threshold_lower).grid(row=5, column=1, sticky="ew")
 
@@ -141,6 +173,7 @@ def get_user_input():
     ttk.Entry(input_frame, textvariable=sig_threshold).grid(row=7, column=1, sticky="ew")
 
     ttk.Checkbutton(input_frame, text="Show Labels", variable=show_labels).grid(row=8, column=0, columnspan=2, sticky="w")
+    ttk.Checkbutton(input_frame, text="Density Mode (large tables)", variable=density).grid(row=8, column=2, sticky="w")
     
     ttk.Label(input_frame, text="Non-Significant Color").grid(row=9, column=0, sticky="w")
     ttk.Entry(input_frame, textvariable=ns_color).grid(row=9, column=1, sticky="ew")
@@ -159,73 +192,36 @@ def get_user_input():
     ttk.Button(input_frame, text="Choose Color", command=lambda: choose_color(poi_color)).grid(row=12, column=2, sticky="ew")
 
     ttk.Label(input_frame, text="Points of Interest").grid(row=13, column=0, sticky="w")
-    pofi_listbox = tk.Listbox(input_frame, listvariable=points_of_interest, selectmode=tk.MULTIPLE)
-    pofi_listbox.grid(row=13, column=1, sticky="ew", columnspan=2)
+    pofi_picker = PointsOfInterestPicker(input_frame, command=schedule_refresh)
+    pofi_picker.grid(row=13, column=1, sticky="ew", columnspan=2)
 
     ttk.Button(input_frame, text="Submit", command=submit).grid(row=14, column=0, columnspan=3, sticky="ew")
 
-    return root
+    for var in (title, fc_threshold_lower, fc_threshold_upper, sig_threshold, show_labels,
+                ns_color, ur_color, dr_color, poi_color):
+        var.trace_add("write", schedule_refresh)
 
-def check_pofi_in_data(pofi, data, name):
-    valid_pofi = []
-    if not pofi:
-        print("No points of interest selected")
-    else:
-        for p in pofi:
-            if p in data[name].values:
-                valid_pofi.append(p)
-            else:
-                print(f'{p} not found in the data')
-    return valid_pofi
+    return root
 
 def plot_volcano():
-    global user_inputs
-    data = user_inputs['data']
-    x = user_inputs['x']
-    y = user_inputs['y']
-    name = user_inputs['name']
-    fc_threshold_lower = user_inputs['fc_threshold_lower']
-    fc_threshold_upper = user_inputs['fc_threshold_upper']
-    sig_threshold = user_inputs['sig_threshold']
-    show_labels = user_inputs['show_labels']
-    ns_color = user_inputs['ns_color']
-    ur_color = user_inputs['ur_color']
-    dr_color = user_inputs['dr_color']
-    poi_color = user_inputs['poi_color']
-    pofi = user_inputs['pofi']
-    valid_pofi = check_pofi_in_data(pofi, data, name)
-    title = user_inputs['title']
-
-    fig, ax = plt.subplots()
-
-    ax.scatter(x=data[x], y=data[y], s=1, label="Not significant", color=ns_color)
-    down = data[(data[x] >= fc_threshold_upper) & (data[y] >= sig_threshold)]
-    up = data[(data[x] <= fc_threshold_lower) & (data[y] >= sig_threshold)]
-    ax.scatter(x=down[x], y=down[y], s=3, label="Up-regulated", color=ur_color)
-    ax.scatter(x=up[x], y=up[y], s=3, label="Down-regulated", color=dr_color)
-
-    texts = []
-    for i in range(len(data)):
-        if data[name][i] in valid_pofi:
-            ax.scatter(data[x][i], data[y][i], s=10, color=poi_color)
-            texts.append(ax.text(data[x][i], data[y][i], data[name][i], fontsize=8, color='black'))
-    adjust_text(texts, arrowprops=dict(arrowstyle="-", color='black', lw=0.5))
-
-    ax.set_xlabel(x)
-    ax.set_ylabel(y)
-    ax.axvline(fc_threshold_lower, color="grey", linestyle="--")
-    ax.axvline(fc_threshold_upper, color="grey", linestyle="--")
-    ax.axhline(sig_threshold, color="grey", linestyle="--")
-    if show_labels:
-        ax.legend()
-    ax.set_title(title)
-
-    for widget in plot_frame.winfo_children():
-        widget.destroy()
+    global user_inputs, view
+
+    # One figure and canvas for the session; later plots update its artists in place
+    if view is not None:
+        view.update(**user_inputs)
+        return
 
+    fig = Figure()
     canvas = FigureCanvasTkAgg(fig, master=plot_frame)
-    canvas.draw()
     canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+    first = VolcanoView(fig, blit=True)
+    try:
+        first.update(**user_inputs)
+    except Exception:
+        canvas.get_tk_widget().destroy()
+        raise
+    # Only a view that has plotted once is kept (and refreshed live)
+    view = first
 
 def main():
     global root
@@ -0,0 +1,380 @@
+"""
+Volcano plot rendering core, free of Tk and pyplot state.
+
+render_volcano() draws into any matplotlib Figure, so the GUI
+(volcano_plot.py) and the headless batch renderer (volcano_batch.py)
+produce identical plots. VolcanoDataset loads the table columns they need.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+from matplotlib.colors import to_rgba
+from label_placer import place_labels
+
+DEFAULT_OPTIONS = {
+    'x': 'Log2FC',
+    'y': 'minuslog10(pval)',
+    'name': 'Name',
+    'fc_threshold_lower': -1.0,
+    'fc_threshold_upper': 1.0,
+    'sig_threshold': 1.3,
+    'show_labels': True,
+    'ns_color': 'lightgrey',
+    'ur_color': 'deepskyblue',
+    'dr_color': 'orangered',
+    'poi_color': 'black',
+    'pofi': [],
+    'title': '',
+    'density': False,
+}
+
+def read_columns(path, columns=None, nrows=None):
+    """Read selected columns of a comparison CSV (byte order mark tolerated)."""
+    if columns is not None:
+        wanted = set(columns)
+        columns = lambda c: c in wanted
+    # utf-8-sig: spreadsheet exports often start with a byte order mark
+    return pd.read_csv(path, usecols=columns, nrows=nrows, encoding="utf-8-sig")
+
+class VolcanoDataset:
+    """
+    One comparison table, loaded lazily and column by column.
+    The header is read on its own; columns are read on first use and cached
+    until the file's modification time or size changes.
+    """
+
+    def __init__(self, path=None):
+        self._path = None
+        self.path = path
+
+    @property
+    def path(self):
+        return self._path
+
+    @path.setter
+    def path(self, path):
+        if path != self._path:
+            self._path = path
+            self._reset(None)
+
+    def _reset(self, signature):
+        self._signature = signature
+        self._columns = None
+        self._cache = {}
+        self._frames = {}
+
+    def _validate(self):
+        if not self._path:
+            raise ValueError("No data file selected")
+        stat = os.stat(self._path)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        if signature != self._signature:
+            self._reset(signature)
+
+    @property
+    def columns(self):
+        """Column names, from the header line only."""
+        self._validate()
+        if self._columns is None:
+            self._columns = list(read_columns(self._path, nrows=0).columns)
+        return self._columns
+
+    def frame(self, columns):
+        """
+        DataFrame of the given columns, reading only those not cached yet.
+        The same frame is returned while the file is unchanged; do not modify it.
+        """
+        columns = list(dict.fromkeys(columns))
+        missing = [c for c in columns if c not in self.columns]
+        if missing:
+            raise KeyError(f"Columns not found: {', '.join(missing)}")
+        key = tuple(columns)
+        if key not in self._frames:
+            to_load = [c for c in columns if c not in self._cache]
+            if to_load:
+                loaded = read_columns(self._path, to_load)
+                self._cache.update({c: loaded[c] for c in to_load})
+            self._frames[key] = pd.DataFrame({c: self._cache[c] for c in columns})
+        return self._frames[key]
+
+    def column(self, column):
+        return self.frame([column])[column]
+
+def check_pofi_in_data(pofi, data, name):
+    valid_pofi = []
+    if not pofi:
+        print("No points of interest selected")
+    else:
+        found = pd.Series(pofi).isin(data[name])
+        for p, ok in zip(pofi, found):
+            if ok:
+                valid_pofi.append(p)
+            else:
+                print(f'{p} not found in the data')
+    return valid_pofi
+
+def density_image(x_values, y_values, layers, bins=400):
+    """
+    RGBA 2D-histogram image of the points and its extent.
+    layers: (mask, color) pairs composited in order, later layers on top.
+    """
+    x_values = np.asarray(x_values, dtype=float)
+    y_values = np.asarray(y_values, dtype=float)
+    finite = np.isfinite(x_values) & np.isfinite(y_values)
+    if not finite.any():
+        return None, None
+    extent = [x_values[finite].min(), x_values[finite].max(),
+              y_values[finite].min(), y_values[finite].max()]
+    if extent[0] == extent[1]:
+        extent[1] += 1
+    if extent[2] == extent[3]:
+        extent[3] += 1
+
+    image = np.zeros((bins, bins, 4))
+    for mask, color in layers:
+        mask = np.asarray(mask) & finite
+        counts, _, _ = np.histogram2d(y_values[mask], x_values[mask], bins=bins,
+                                      range=[extent[2:], extent[:2]])
+        if not counts.any():
+            continue
+        # Log-scaled opacity keeps sparse bins visible next to dense ones
+        alpha = np.log1p(counts) / np.log1p(counts.max())
+        rgba = np.array(to_rgba(color))
+        layer_alpha = alpha[..., None] * rgba[3]
+        image[..., :3] = rgba[:3] * layer_alpha + image[..., :3] * (1 - layer_alpha)
+        image[..., 3:] = layer_alpha + image[..., 3:] * (1 - layer_alpha)
+    return image, extent
+
+class VolcanoView:
+    """
+    A volcano plot kept on one figure and updated in place.
+
+    The first update() builds the artists; later calls only touch what changed
+    (scatter offsets and colours, threshold line positions, labels, legend,
+    title). A new table, new x/y/name columns, density mode or a threshold
+    outside the current axes limits rebuilds the plot.
+
+    With blit=True (interactive canvases) the parts that change between
+    updates are animated artists drawn over a cached background, so most
+    updates redraw only those artists.
+    """
+
+    # Options that change which artists exist or the axes limits
+    _STRUCTURE = ('x', 'y', 'name', 'density')
+
+    def __init__(self, fig, blit=False):
+        self.fig = fig
+        self.blit = blit
+        self.ax = None
+        self.options = None
+        self.labels = []
+        self._background = None
+        if blit:
+            fig.canvas.mpl_connect('draw_event', self._on_draw)
+
+    def update(self, data, x, y, name, fc_threshold_lower, fc_threshold_upper, sig_threshold,
+               show_labels=False, ns_color='lightgrey', ur_color='deepskyblue',
+               dr_color='orangered', poi_color='black', pofi=(), title='', density=False):
+        """Show the plot for these options (render_volcano() arguments). Returns the axes."""
+        options = dict(data=data, x=x, y=y, name=name, fc_threshold_lower=fc_threshold_lower,
+                       fc_threshold_upper=fc_threshold_upper, sig_threshold=sig_threshold,
+                       show_labels=show_labels, ns_color=ns_color, ur_color=ur_color,
+                       dr_color=dr_color, poi_color=poi_color, pofi=list(pofi), title=title,
+                       density=density)
+        previous, self.options = self.options, options
+        try:
+            self._apply(previous)
+        except Exception:
+            # Leave no half-applied state behind: rebuild on the next update
+            self.options = None
+            raise
+        return self.ax
+
+    def _apply(self, previous):
+        options = self.options
+        if self._needs_rebuild(previous):
+            self._build()
+            if self.blit:
+                self.fig.canvas.draw()
+            return
+
+        changed = {k for k in options if k != 'data' and options[k] != previous[k]}
+        if not changed:
+            return
+        thresholds = bool(changed & {'fc_threshold_lower', 'fc_threshold_upper', 'sig_threshold'})
+        colors = bool(changed & {'ns_color', 'ur_color', 'dr_color'})
+        # Changes to artists in the cached background need a full draw
+        full_draw = (options['density'] and (thresholds or colors)) or 'ns_color' in changed
+
+        if thresholds:
+            self._masks()
+            self.lower.set_xdata([options['fc_threshold_lower']] * 2)
+            self.upper.set_xdata([options['fc_threshold_upper']] * 2)
+            self.sig.set_ydata([options['sig_threshold']] * 2)
+        if options['density']:
+            if full_draw and self.image is not None:
+                self.image.set_data(self._density_image()[0])
+        elif thresholds:
+            self.up.set_offsets(self._points(self.up_mask))
+            self.down.set_offsets(self._points(self.down_mask))
+        for artist, key in ((self.ns, 'ns_color'), (self.up, 'ur_color'),
+                            (self.down, 'dr_color'), (self.poi, 'poi_color')):
+            if key in changed:
+                artist.set_color(options[key])
+        if 'pofi' in changed:
+            self.poi_mask = self._poi_mask()
+            self.poi.set_offsets(self._points(self.poi_mask))
+        if colors or 'show_labels' in changed:
+            self._legend()
+        if 'title' in changed:
+            self.ax.set_title(options['title'])
+        if thresholds or 'pofi' in changed:
+            self._place_labels()
+
+        if self.blit:
+            if full_draw:
+                self.fig.canvas.draw()
+            else:
+                self._blit()
+
+    def _needs_rebuild(self, previous):
+        if previous is None or self.options['data'] is not previous['data']:
+            return True
+        if any(self.options[k] != previous[k] for k in self._STRUCTURE):
+            return True
+        (x0, x1), (y0, y1) = self.ax.get_xlim(), self.ax.get_ylim()
+        o = self.options
+        return not (x0 <= o['fc_threshold_lower'] <= x1 and x0 <= o['fc_threshold_upper'] <= x1
+                    and y0 <= o['sig_threshold'] <= y1)
+
+    def _masks(self):
+        o, data = self.options, self.options['data']
+        significant = data[o['y']] >= o['sig_threshold']
+        self.up_mask = ((data[o['x']] >= o['fc_threshold_upper']) & significant).to_numpy()
+        self.down_mask = ((data[o['x']] <= o['fc_threshold_lower']) & significant).to_numpy()
+
+    def _poi_mask(self):
+        o = self.options
+        valid_pofi = check_pofi_in_data(o['pofi'], o['data'], o['name'])
+        return o['data'][o['name']].isin(valid_pofi).to_numpy()
+
+    def _points(self, mask):
+        return np.column_stack([self._x[mask], self._y[mask]])
+
+    def _density_image(self):
+        o = self.options
+        all_rows = np.ones(len(self._x), dtype=bool)
+        return density_image(self._x, self._y, [(all_rows, o['ns_color']), (self.up_mask, o['ur_color']),
+                                                (self.down_mask, o['dr_color'])])
+
+    def _build(self):
+        o, data = self.options, self.options['data']
+        x, y = o['x'], o['y']
+        self._x = data[x].to_numpy(dtype=float)
+        self._y = data[y].to_numpy(dtype=float)
+        self._masks()
+        self._background = None
+        self.labels = []
+
+        self.fig.clf()
+        ax = self.ax = self.fig.add_subplot()
+
+        self.image = None
+        if o['density']:
+            image, extent = self._density_image()
+            if image is not None:
+                self.image = ax.imshow(image, extent=extent, origin="lower", aspect="auto",
+                                       interpolation="nearest")
+            # Empty artists so the legend still shows the classes
+            self.ns = ax.scatter([], [], s=1, label="Not significant", color=o['ns_color'])
+            self.up = ax.scatter([], [], s=3, label="Up-regulated", color=o['ur_color'])
+            self.down = ax.scatter([], [], s=3, label="Down-regulated", color=o['dr_color'])
+        else:
+            self.ns = ax.scatter(x=self._x, y=self._y, s=1, label="Not significant", color=o['ns_color'])
+            self.up = ax.scatter(*self._points(self.up_mask).T, s=3, label="Up-regulated",
+                                 color=o['ur_color'])
+            self.down = ax.scatter(*self._points(self.down_mask).T, s=3, label="Down-regulated",
+                                   color=o['dr_color'])
+
+        self.poi_mask = self._poi_mask()
+        self.poi = ax.scatter(*self._points(self.poi_mask).T, s=10, color=o['poi_color'])
+
+        ax.set_xlabel(x)
+        ax.set_ylabel(y)
+        self.lower = ax.axvline(o['fc_threshold_lower'], color="grey", linestyle="--")
+        self.upper = ax.axvline(o['fc_threshold_upper'], color="grey", linestyle="--")
+        self.sig = ax.axhline(o['sig_threshold'], color="grey", linestyle="--")
+        self._legend()
+        ax.set_title(o['title'])
+        # Freeze the limits so later updates do not move the axes
+        ax.set_xlim(ax.get_xlim())
+        ax.set_ylim(ax.get_ylim())
+
+        if self.blit:
+            dynamic = [self.poi, self.lower, self.upper, self.sig, ax.title]
+            if not o['density']:
+                dynamic += [self.up, self.down]
+            for artist in dynamic:
+                artist.set_animated(True)
+
+        # Placed last so the axes limits (and so label positions on screen) are final
+        self._place_labels()
+
+    def _legend(self):
+        if self.ax.get_legend() is not None:
+            self.ax.get_legend().remove()
+        if self.options['show_labels']:
+            self.ax.legend().set_animated(self.blit)
+
+    def _place_labels(self):
+        o = self.options
+        for artist in self.labels:
+            artist.remove()
+        poi = self.poi_mask
+        names = o['data'][o['name']].to_numpy()[poi]
+        regulated = self.up_mask | self.down_mask
+        self.labels = place_labels(self.ax, self._x[poi], self._y[poi], names, fontsize=8,
+                                   color='black', avoid_x=self._x[regulated],
+                                   avoid_y=self._y[regulated], time_budget=2.0)
+        for artist in self.labels:
+            artist.set_animated(self.blit)
+
+    def _animated(self):
+        # Same order as a full draw
+        return sorted((a for a in self.ax.get_children() if a.get_animated()), key=lambda a: a.get_zorder())
+
+    def _on_draw(self, event):
+        # Full draws skip animated artists: cache what was drawn, then add them on top
+        if self.ax is None:
+            return  # Nothing built yet (first update failed)
+        canvas = self.fig.canvas
+        self._background = canvas.copy_from_bbox(self.fig.bbox)
+        for artist in self._animated():
+            self.fig.draw_artist(artist)
+
+    def _blit(self):
+        if self.ax is None:
+            return
+        canvas = self.fig.canvas
+        if self._background is None:
+            canvas.draw()
+            return
+        canvas.restore_region(self._background)
+        for artist in self._animated():
+            self.fig.draw_artist(artist)
+        canvas.blit(self.fig.bbox)
+        canvas.flush_events()
+
+def render_volcano(fig, data, x, y, name, fc_threshold_lower, fc_threshold_upper, sig_threshold,
+                   show_labels=False, ns_color='lightgrey', ur_color='deepskyblue',
+                   dr_color='orangered', poi_color='black', pofi=(), title='', density=False):
+    """
+    Draw a volcano plot into fig (cleared first) and return its axes.
+    fig needs a canvas that can render (Agg, TkAgg...) for label placement.
+    """
+    return VolcanoView(fig).update(data, x, y, name, fc_threshold_lower, fc_threshold_upper,
+                                   sig_threshold, show_labels=show_labels, ns_color=ns_color,
+                                   ur_color=ur_color, dr_color=dr_color, poi_color=poi_color,
+                                   pofi=pofi, title=title, density=density)